@@ -1,21 +1,21 @@
 import streamlit as st
 import pandas as pd
 from datetime import date, datetime, timedelta
-import math
 import streamlit.components.v1 as components
-from utils.textbreakdown import parse_lms_to_dic
+from utils.textbreakdown import parse_lms_fast
 from utils.textbreakdown import process_email_data
 from utils.dic_data import defaults
 from utils.dic_data import maker_data
-from utils.dic_data import (hibor_refixing_df,hibor_refixing_date)
-from utils.dic_data import hibor_cal
+from utils import rate_store
+from utils.interest_engine import compute_interest, rate_version_note
 import re
 # ------------------ Session State Initialization ------------------
 today = date.today().strftime('%Y-%m-%d')
 for k, v in defaults.items():
     st.session_state.setdefault(k, v)
-if "sofr_df" in st.session_state:
-    sofr_df = st.session_state["sofr_df"]
+if st.session_state.get("rate_version") is not None:
+    # 会话只存版本号；利率索引是进程内共享的只读对象
+    rate_index = rate_store.shared_rate_index(st.session_state["rate_version"])
 else:
     st.warning("Please Import Interest Rate Info First")
 if "raw_input" not in st.session_state:
@@ -30,14 +30,13 @@ if "prdtype_slider" not in st.session_state:
 
 # ------------------ Refresh Logic ------------------
 def clear_text():
-    # 1) 保留 'sofr_df'
-    preserved = {}
-    if "sofr_df" in st.session_state:
-        preserved["sofr_df"] = st.session_state["sofr_df"]
+    # 1) 保留锁定的利率版本
+    keep = ("rate_version",)
+    preserved = {k: st.session_state[k] for k in keep if k in st.session_state}
 
-    # 2) 删除除 'sofr_df' 之外的所有会话键
+    # 2) 删除除保留项之外的所有会话键
     for k in list(st.session_state.keys()):
-        if k != "sofr_df":
+        if k not in keep:
             st.session_state.pop(k, None)
 
     # 3) 恢复保留项
@@ -58,7 +57,7 @@ def clear_text():
 # ------------------ Utility ------------------
 def on_bulk_text_change():
     text = st.session_state["bulk_text"]
-    values = parse_lms_to_dic(text)
+    values = parse_lms_fast(text)
 
     for k in defaults.keys():
         if k in values:
@@ -104,10 +103,6 @@ def adjust_drawdown(drawdown_date: datetime, t0_date: date = date(2025, 6, 23))
         drawdown_date -= timedelta(days=1)
     return drawdown_date
 
-def trunc(num, digits):
-    factor = 10 ** digits
-    return math.trunc(num * factor) / factor
-
 def get_prdtype(drawdown_id):
     s = "" if drawdown_id is None else str(drawdown_id)
     s_norm = s.strip().upper()
@@ -246,109 +241,47 @@ if output_button and raw_input.strip():
                 ratetype = st.sidebar.select_slider("Rate Type", options=["SOFR+", "HIBOR+", "Fixed"],value=st.session_state.ratetype_slider,label_visibility="collapsed", key="ratetype_slider")
                 prdtype = st.sidebar.select_slider("Product Type", options=["Regular", "RFPO"],value=st.session_state.prdtype_slider,label_visibility="collapsed", key="prdtype_slider")
 
-    #Calculation Part
-        if prdtype == "RFPO":
-            principal_cal = outstanding_principal
-            sme_drawdown_cal = last_funder_submission if last_funder_submission != date(1999, 1, 1) else sme_drawdown_cal
-        else:
-            principal_cal = principal
-
-
-
-        #previous hiborcCAL : float_rate = 'Daily Calculated Blended HIBOR' if ratetype == 'HIBOR+' else 'SOFR'
-        if ratetype == 'HIBOR+':
-            sofr_df = hibor_cal(sme_drawdown, repayment_date, sofr_df, sme_mit_days, hibor_refixing_df)
-            float_rate = 'Applied HIBOR'
-        else:
-            float_rate = 'SOFR'
-        hdays = (repayment_date - sme_drawdown_cal).days
-        regul_floatsum = sofr_df.loc[(sofr_df['Calculation Date'] > sme_drawdown_cal) & 
-                                    (sofr_df['Calculation Date'] <= repayment_date), float_rate].sum()
-        overdue_interest = 0
-        if repayment_date <= mit_repaydate:
-            note = "MIT"
-            mit_fillrate = sofr_df.loc[(sofr_df['Calculation Date'] == repayment_date), float_rate].iloc[0]
-            floatsum = (sme_mit  - hdays) * mit_fillrate + regul_floatsum
-            hdays = sme_mit
-        elif repayment_date > expected_repaydate:
-            note = "Overdue"
-            floatsum = regul_floatsum
-            overdue_hdays = (repayment_date - expected_repaydate).days
-            overduesum = sofr_df.loc[(sofr_df['Calculation Date'] > expected_repaydate) & 
-                                    (sofr_df['Calculation Date'] <= repayment_date), float_rate].sum()
-        else:
-            note = "Normal"
-            floatsum = regul_floatsum
-
-        sme_interest = 0
-        overdue_interest = 0
-        if ratetype == "Fixed":
-            floatsum = 0
-            overduesum =0
-        sme_interest = trunc((floatsum + funder_intrate * hdays) / 360 * principal_cal * 0.01, 2)
-        if note == "Overdue":
-            overdue_interest = trunc((overduesum + funder_intrate * overdue_hdays) / 360 * principal_cal * 0.01, 2)
-        if note != "Overdue" or prdtype == "RFPO":
-            overdue_interest = 0
-        
-        sme_allinterest = sme_interest + overdue_interest
-
-    
-        if prdtype == "RFPO" or funder_drawdown_cal == sme_drawdown_cal:
-            funder_interest = sme_interest + overdue_interest
-        else:
-            funder_hdays = (repayment_date - funder_drawdown_cal).days
-            funder_regul_floatsum = sofr_df.loc[(sofr_df['Calculation Date'] > funder_drawdown_cal) & (sofr_df['Calculation Date'] <= repayment_date), float_rate].sum()
-            funder_overdue_interest = 0
-            if ratetype == "Fixed":
-                funder_regul_floatsum = 0
-            if funder_drawdown <= expected_repaydate:
-                funder_regulint = trunc((funder_regul_floatsum + funder_intrate * funder_hdays) / 360 * principal_cal * 0.01, 2)
-                funder_odint = overdue_interest
-                funder_interest = funder_regulint + funder_odint
-
-            else:
-                funder_overdue_hdays = (funder_drawdown_cal - repayment_date).days
-                funder_overduesum = sofr_df.loc[(sofr_df['Calculation Date'] > funder_drawdown_cal) & 
-                                            (sofr_df['Calculation Date'] <= repayment_date), float_rate].sum()
-                if ratetype == "Fixed":
-                    funder_regul_floatsum = 0
-
-                funder_interest = trunc((funder_regul_floatsum + funder_intrate * funder_hdays) / 360 * principal_cal * 0.01, 2)*2
-#allocation part
-        
-        waived_interest = waived_smeint + waived_smeodint
-        waived_interest = waived_interest * -1
-        waived_bankcharge = waived_bankcharge * -1
-        if xdj_switch == 0:
-            funder_interest += surcharge_item - waived_interest
-            if funder_interest >= waived_bankcharge and fundertype == "Main":
-                funder_interest -= waived_bankcharge
-
-        if platform_fee != 0:
-            platform_fee = funder_interest * 0.01
-        else:
-            platform_fee = 0
-
-        if xdj_switch:
-            funder_interest += surcharge_item
-            if funder_interest >= waived_bankcharge and fundertype == "Main":
-                funder_interest -= waived_bankcharge
-
-        if fundertype == "Zero":
-            funder_interest = 0
-
-        spreading = (sme_interest + overdue_interest) + surcharge_item - waived_bankcharge - waived_interest - funder_interest
+    #Calculation Part（见 utils/interest_engine.compute_interest，与批量复核共用同一套算法）
+        trade = pd.DataFrame([{
+            "drawdown_id": drawdown_id,
+            "funder_id": funder_id,
+            "sme_intrate": sme_intrate,
+            "sme_drawdown": sme_drawdown,
+            "funder_drawdown": funder_drawdown,
+            "last_funder_submission": last_funder_submission,
+            "repayment_date": st.session_state["repayment_date"],  # Rollover 调整在 engine 内完成
+            "sme_tenor": sme_tenor,
+            "sme_mit": sme_mit,
+            "outstanding_principal": outstanding_principal,
+            "principal": principal,
+            "sme_sysint": sme_sysint,
+            "sme_sysodint": sme_sysodint,
+            "waived_bankcharge": waived_bankcharge,
+            "waived_smeint": waived_smeint,
+            "waived_smeodint": waived_smeodint,
+            "surcharge_item": surcharge_item,
+            "funder_sysint": funder_sysint,
+            "funder_intrate": funder_intrate,
+            "platform_fee": platform_fee,
+            "spreading_sysint": spreading_sysint,
+            "opstype": opstype,
+            "xdj": xdj_switch,
+            "fundertype": fundertype,
+            "ratetype": ratetype,
+            "prdtype": prdtype,
+        }])
+        result = compute_interest(trade, rate_index).iloc[0]
+        regul_floatsum = result["regul_floatsum"]
+        sme_interest = result["sme_interest"]
+        overdue_interest = result["overdue_interest"]
+        funder_interest = result["funder_interest"]
+        platform_fee = result["platform_fee"]
+        spreading = result["spreading"]
 
         with col1:
-            #for calcu
-            threshold = 0.02
-            def check_differences(system,calculation, threshold):
-                status = "ok" if abs(calculation - system) < threshold else "err"
-                return abs(calculation - system), f"{status}: {round(calculation - system,2)}"
-            smegap, sme_checker= check_differences( sme_sysint + sme_sysodint ,sme_allinterest, threshold)
-            fundergap,funder_checker= check_differences(funder_sysint,funder_interest, threshold)
-            spreadinggap,spreading_checker = check_differences(spreading_sysint,spreading, threshold)
+            smegap, sme_checker = result["smegap"], result["sme_checker"]
+            fundergap, funder_checker = result["fundergap"], result["funder_checker"]
+            spreadinggap, spreading_checker = result["spreadinggap"], result["spreading_checker"]
 
             resubcol1, resubcol2, resubcol3, resubcol4 = st.columns([1, 3, 3, 3])
             with resubcol1:
@@ -359,6 +292,8 @@ if output_button and raw_input.strip():
                 st.metric(label="Funder:", value=f"{funder_checker}")
             with resubcol4:
                 st.metric(label="Spreading:", value=f"{spreading_checker}")
+            if result["rate_version"] is not None:
+                st.caption(f"Rate version: v{int(result['rate_version'])}")
 
             warnings = []
             if outstanding_principal - principal < 10 and outstanding_principal - principal > 0.001:
@@ -372,6 +307,8 @@ if output_button and raw_input.strip():
                 warnings.append("⚠️ Funder code violation: funder type is 'Main' but Funder interest is 0 — main funders are expected to earn interest.")
             if fundertype == "Zero" and funder_sysint != 0:
                 warnings.append(f"⚠️ Funder code violation: funder type is 'Zero' but Funder interest is {funder_sysint} — zero-interest funders should not earn interest.")
+            if result["rate_gap_days"] > 0:
+                warnings.append(f"⚠️ Rate data missing: {int(result['rate_gap_days'])} day(s) in the accrual period have no {ratetype} rate — please update the interest rate info.")
             if opstype == "Repayment":
                 if rtb_sys != 0:
                     warnings.append(f"⚠️ Condition failed: rtb_sys should be 0, but is {rtb_sys}")
@@ -400,9 +337,8 @@ if output_button and raw_input.strip():
             if opstype == "Rollover":
                 maker_df["Sub"] = rtb_sys
                 maker_df["Total Amount"] = principal + funder_sysint + spreading_sysint + platform_fee
-            mxgap =  max(smegap,fundergap,spreadinggap)
-            checker = "ok" if mxgap < threshold else "err"
-            maker_df["Checker"] = f"{checker}: {round(mxgap,2)}"
+            maker_df["Checker"] = result["checker"]
+            maker_df["Note"] = rate_version_note(result["rate_version"])
             maker_df["Note2"] = repayment_id
     if data_source == "Email":
         with col1:
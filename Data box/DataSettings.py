@@ -2,12 +2,14 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, date
+from utils.rate_index import RateIndex
+from utils import rate_store
 
 # -------------------------------
 # 小工具函数（统一日期类型 & 安全格式化）
 # -------------------------------
 def ensure_date_col(df: pd.DataFrame, cols: list) -> pd.DataFrame:
-    """把指定列统一成 datetime.date（便于与 sofr_df 比较，不用 .dt）"""
+    """把指定列统一成 datetime.date（便于与利率库日期比较，不用 .dt）"""
     for c in cols:
         if c in df.columns:
             df[c] = pd.to_datetime(df[c], errors='coerce').dt.date
@@ -34,27 +36,31 @@ def format_dataframe(df: pd.DataFrame) -> pd.DataFrame:
 # -------------------------------
 # 配置与初始化
 # -------------------------------
-DATA_PATH = "Tadata/updated_df.csv"  # <-- 这里按你的实际路径设置
+DATA_PATH = "Tadata/updated_df.csv"  # 导出 / 首次建库的种子 CSV
+DB_PATH = "Tadata/rates.sqlite"      # 利率库（日期、利率均为类型化列，增量追加）
 
 # today 用 date 类型；文件名时再格式化
 today = date.today()
 
-# 缓存加载函数（保持 Calculation Date 为 datetime.date）
-@st.cache_data
-def load_sofr_data() -> pd.DataFrame:
-    df = pd.read_csv(DATA_PATH)
-    # 统一成 Timestamp 再转成 date（保持你设定好的 date 格式）
-    df["Calculation Date"] = pd.to_datetime(df["Calculation Date"],errors="coerce",dayfirst=False).dt.date
-    return df
+# 利率索引按版本在进程内共享（rate_store.shared_rate_index），所有会话用同一个只读对象；
+# 会话里只保存版本号，不再各存一份 sofr_df。已发布的版本不会再变，上传新版本不必清缓存
+def load_versions() -> pd.DataFrame:
+    return rate_store.list_versions(DB_PATH)
+
+def pin_rate_version(version: int) -> RateIndex:
+    """把本会话锁定到某个利率版本（计算结果会记录该版本号）"""
+    st.session_state["rate_version"] = version
+    return rate_store.shared_rate_index(version, DB_PATH)
 
 # 预加载（如果文件不存在，这里会报错；你也可以包 try/except）
-sofr_df = load_sofr_data()
+versions = load_versions()
+latest_version = int(versions["Version"].iloc[0]) if len(versions) else None
 
 # 会话状态
 if "data_loaded" not in st.session_state:
     st.session_state["data_loaded"] = False
-if "sofr_df" not in st.session_state:
-    st.session_state["sofr_df"] = sofr_df
+if "rate_version" not in st.session_state and latest_version is not None:
+    pin_rate_version(latest_version)
 
 # -------------------------------
 # UI 布局
@@ -65,15 +71,30 @@ col1, col2 = st.columns([3, 2])
 # 加载按钮
 # -------------------------------
 with col2:
-    if st.button("⚙️ Import Interest Rate Info"):
+    # 默认最新版本；也可以选旧版本重算
+    version = st.selectbox(
+        "Rate Version", versions["Version"].tolist(),
+        format_func=lambda v: f"v{v} (to {versions.set_index('Version').at[v, 'Last Date']:%Y-%m-%d})",
+    )
+    if latest_version is None:
+        # 利率库还没有任何版本：先在左侧上传利率表，发布 v1 后再锁定
+        st.info("No interest rate version yet. Please upload the FP2.0 Interest Rate Excel first.")
+    else:
+        st.caption(f"Current session: v{st.session_state.get('rate_version')}")
+    if st.button("⚙️ Import Interest Rate Info", disabled=version is None):
         try:
-            sofr_df = load_sofr_data()
-            st.session_state["sofr_df"] = sofr_df
+            rate_index = pin_rate_version(version)
             st.session_state["data_loaded"] = True
 
             # last_date 是 datetime.date
-            last_date = sofr_df["Calculation Date"].dropna().max()
-            st.success(f"✅ Data loaded successfully! Last update date: {last_date.strftime('%Y-%m-%d')}")
+            last_date = rate_index.last_date
+            st.success(f"✅ Data loaded successfully! Version v{version}, last update date: {last_date.strftime('%Y-%m-%d')}")
+
+            # 载入时就提示缺失的日期，避免计算时才发现
+            gaps = rate_index.gaps()
+            if gaps:
+                gap_text = ", ".join(a.strftime('%Y-%m-%d') if a == b else f"{a:%Y-%m-%d} ~ {b:%Y-%m-%d}" for a, b in gaps)
+                st.warning(f"⚠️ Missing rate dates: {gap_text}")
         except Exception as e:
             st.error(f"❌ Failed to load data：{e}")
 
@@ -85,12 +106,6 @@ with col1:
 
     upload_file = st.file_uploader("Please upload the FP2.0 Interest Rate Excel", type=["xlsx"])
 
-    # 取当前主数据（保持为 date 格式）
-    update_target_df = st.session_state.get("sofr_df", sofr_df)
-
-    # 最新已更新日期（用列名更稳，不用 iloc）
-    update_target_d = update_target_df["Calculation Date"].dropna().max() if not update_target_df.empty else None
-
     if upload_file is not None:
         try:
             # 读取并初步格式化（第1列转 Timestamp）
@@ -103,36 +118,29 @@ with col1:
                 "HIBOR (SME)": "Daily Calculated Blended HIBOR"
             })
 
-            # ✅ 将上传数据的日期列统一为 datetime.date（与 sofr_df 保持一致）
+            # ✅ 将上传数据的日期列统一为 datetime.date（与利率库保持一致）
             update_info_df = ensure_date_col(update_info_df, ["Calculation Date", "SOFR Date"])
 
             # 排序（按 date）
             update_info_df = update_info_df.sort_values(by="Calculation Date")
 
-            # ✅ 用 date 比较，保证两边类型一致
-            if update_target_d is not None:
-                update_info_df = update_info_df[update_info_df["Calculation Date"] > update_target_d]
-            # else: 如果历史数据没有有效日期，则全部视为新增
-
-            # 追加并保持日期列为 date
-            updated_df = pd.concat([update_target_df, update_info_df], axis=0, ignore_index=True)
-            updated_df = ensure_date_col(updated_df, ["Calculation Date", "SOFR Date"])
+            # 只追加库内最后日期之后的行，发布为新版本（单个事务，原子切换），不再重写整份 CSV
+            # 已打开页面的会话仍使用各自锁定的版本，不清缓存
+            new_version, added = rate_store.append_rates(update_info_df, DB_PATH)
 
-            # 去重（可选，防止重复日期导致计算偏差）
-            updated_df = updated_df.drop_duplicates(subset=["Calculation Date"], keep="last")
+            conn = rate_store.connect(DB_PATH)
+            last_date = rate_store.last_date(conn)
+            conn.close()
 
-            # 最后日期（仍为 date）
-            last_date = updated_df["Calculation Date"].dropna().max()
-
-            # 保存主 CSV（CSV 内是字符串；load_sofr_data 会再统一为 date）
-            updated_df.to_csv(DATA_PATH, index=False)
-
-            # 清缓存，让重新导入时生效
-            st.cache_data.clear()
-
-            st.success(f"Updated: {last_date.strftime('%Y-%m-%d')}. 🔄 Please Re-import Interest Rate Info")
+            if new_version is None:
+                st.info(f"No new rows after {last_date.strftime('%Y-%m-%d')}; rate version unchanged.")
+            else:
+                st.success(f"Published v{new_version}: {last_date.strftime('%Y-%m-%d')} (+{added} rows). 🔄 Please Re-import Interest Rate Info")
 
         except Exception as e:
             st.error(f"❌ Failed to load data：{e}")
 
-
+    # CSV 仍可导出（与原 updated_df.csv 格式相同）
+    if st.button("📄 Prepare CSV Export"):
+        st.download_button("⬇️ Download updated_df.csv", rate_store.export_csv(None, DB_PATH, version),
+                           file_name="updated_df.csv", mime="text/csv")
@@ -1,25 +1,20 @@
 
 import pandas as pd
-import msoffcrypto
-from io import BytesIO
-import re
 import streamlit as st
+from utils.lianlian import load_lianlian, load_lianlian_batch, seller_totals, DEDUCTION_COLUMNS
 
 
-uploaded_file = st.file_uploader("Upload Lianlian Excel", type=["xlsx"])
+# 一个文件：单个工作簿明细；多个文件：月末批量合并
+uploaded_files = st.file_uploader("Upload Lianlian Excel", type=["xlsx"], accept_multiple_files=True) or []
+uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
 if uploaded_file:
     try:
-        office_file = msoffcrypto.OfficeFile(uploaded_file)
-        office_file.load_key(password="llqbd2019")
-
-        decrypted = BytesIO()
-        office_file.decrypt(decrypted)
-
-        sheets = pd.read_excel(decrypted, sheet_name=None, engine='openpyxl')
+        # 解密 + 读表按文件内容缓存，页面重跑时直接取缓存；只读 Summary 和四位数字表的所需列
+        workbook = load_lianlian(uploaded_file)
     # Duduction Date
-        if 'Deduction' in sheets:
-            deduction_df = sheets['Summary']
-            required_columns = ['Company Name', 'Deduction Amount', 'Deduction Date']  # 请根据实际列名修改
+        deduction_df = workbook["deduction"]
+        if deduction_df is not None:
+            required_columns = DEDUCTION_COLUMNS  # 请根据实际列名修改（utils/lianlian.py）
             missing_cols = [col for col in required_columns if col not in deduction_df.columns]
 
             if missing_cols:
@@ -36,16 +31,8 @@ if uploaded_file:
         else:
             st.warning("Empty Data, Please Check the Excel")
 
-    # 第二部分：筛选四位数字表名中的 TRUNC P 和 Repaid Loan P
-        combined_df = pd.DataFrame()
-        for sheet_name, df in sheets.items():
-            clean_name = sheet_name.replace(" ", "")
-            if re.fullmatch(r"\d{4}", clean_name):
-                if 'TRUNC P' in df.columns and 'Repaid Loan P' in df.columns:
-                    filtered_df = df[df['TRUNC P'].notna() & df['Repaid Loan P'].notna()]
-                    if not filtered_df.empty:
-                        filtered_df['Sheet Name'] = sheet_name
-                        combined_df = pd.concat([combined_df, filtered_df], ignore_index=True)
+    # 第二部分：四位数字表名中 TRUNC P 和 Repaid Loan P 都有值的行（已在加载时筛选并合并）
+        combined_df = workbook["trades"]
 
         if not combined_df.empty:
             for col in combined_df.select_dtypes(include=['datetime64[ns]']).columns:
@@ -73,4 +60,29 @@ if uploaded_file:
 
 
     except Exception as e:
-        st.error(f"Failed：{e}")
\ No newline at end of file
+        st.error(f"Failed：{e}")
+
+
+if len(uploaded_files) > 1:
+    # 多个工作簿按文件并行解密读取（按内容缓存），合并明细（File 列为来源文件），再按 Seller Name 汇总 TRUNC P
+    with st.spinner(f"Loading {len(uploaded_files)} workbooks..."):
+        batch_df, files_df = load_lianlian_batch(uploaded_files)
+
+    st.subheader("Files")
+    st.dataframe(files_df, hide_index=True)
+    skipped = files_df.loc[files_df["Error"] != "", "File"].tolist()
+    if skipped:
+        st.warning(f"Not included: {', '.join(skipped)}")
+
+    if not batch_df.empty:
+        for col in batch_df.select_dtypes(include=['datetime']).columns:
+            batch_df[col] = batch_df[col].dt.strftime('%Y-%m-%d')
+
+        st.subheader("Trades Overview")
+        st.dataframe(batch_df, hide_index=True)
+
+        total_trunc_p = pd.to_numeric(batch_df['TRUNC P'], errors='coerce').sum()
+        st.markdown(f"**Total Payment：** {total_trunc_p:,.2f}")
+        st.dataframe(seller_totals(batch_df), hide_index=True)
+    else:
+        st.warning("Empty Data, Please Check the Excel")
@@ -1,9 +1,12 @@
 import streamlit as st
 import pandas as pd
-import xlrd
 import numpy as np
-funder_format = pd.read_excel("Tadata/funder_data.xlsx"
-                              ,converters={"Account no.": lambda x: str(x).strip() if pd.notna(x) else None})
+from datetime import date, timedelta
+from utils.funder_balance import load_funder_format, load_dbs, load_lms, fill_balances
+from utils import balance_store
+
+# 参考表每个进程只读一次（文件修改后自动重读）
+funder_format = load_funder_format()
 
 
 # 页面布局
@@ -12,43 +15,14 @@ col1, col2 = st.columns([3, 1])
 with col2:
     dbs_file = st.file_uploader("Upload DBS Excel", type=["xls"])
     lms_file = st.file_uploader("Upload LMS Excel", type=["xlsx"])
+    snap_date = st.date_input("Balance date", value=date.today())
 
-# 处理 DBS 文件
-if dbs_file is not None:
-    dbs_df = pd.read_excel(dbs_file, skiprows=2, engine="xlrd",converters={"Account Number": lambda x: str(x).strip() if pd.notna(x) else None})
-    selected_cols = ["Account Number", "Currency", "Available Balance"]
-
-    funder_format['Account no.'] = funder_format['Account no.'].astype('string')
-    dbs_df['Account Number']= dbs_df['Account Number'].astype('string')
-
-    dbs_df = dbs_df[selected_cols]
-
-    dbs_df['Currency'] = dbs_df['Currency'].replace('CNH', 'CNY')  # 替换 CNH 为 CNY
-
-    merged_df = funder_format.merge(
-        dbs_df,
-        left_on=["Account no.", "Currency"],
-        right_on=["Account Number", "Currency"],
-        how="left"
-    )
-    merged_df["Bank record"] = merged_df["Available Balance"]
-    funder_format = merged_df.drop(columns=["Account Number", "Available Balance"])
-
-# 处理 LMS 文件
-if lms_file is not None:
-    lms_df = pd.read_excel(lms_file)
-    lms_df['Currency'] = lms_df['Currency'].replace('CNH', 'CNY')  # 替换 CNH 为 CNY
-    selected_cols = ["Funder ID", "Currency", "Ledger Balance"]
-    lms_df = lms_df[selected_cols]
-
-    merged_df = funder_format.merge(
-        lms_df,
-        left_on=["Funder list", "Currency"],
-        right_on=["Funder ID", "Currency"],
-        how="left"
-    )
-    merged_df["LMS Amt"] = merged_df["Ledger Balance"]
-    funder_format = merged_df.drop(columns=["Funder ID", "Ledger Balance"])
+# DBS / LMS 文件按内容缓存解析结果，再按 (账户/Funder, 币种) 索引填入参考表
+funder_format = fill_balances(
+    funder_format,
+    bank=load_dbs(dbs_file) if dbs_file is not None else None,
+    lms=load_lms(lms_file) if lms_file is not None else None,
+)
 
 # 显示原始数据
 with col1:
@@ -70,5 +44,33 @@ with col1:
             st.subheader("Difference Details")
             st.dataframe(df)
 
+            # 当天快照写入历史库；页面重跑时结果没变就不重复写
+            snap_sig = (snap_date, int(pd.util.hash_pandas_object(funder_format, index=False).sum()))
+            if st.session_state.get("balance_saved") != snap_sig:
+                balance_store.record_snapshot(funder_format, snap_date)
+                st.session_state["balance_saved"] = snap_sig
+
         else:
             st.error(f"Missing required columns: {required_cols}")
+
+# 历史余额：趋势与差异首次出现的日期（直接查历史库，不需要重新上传旧文件）
+with st.expander("📈 Balance history"):
+    dates = balance_store.snapshot_dates()
+    if not dates:
+        st.info("No balance snapshots yet — upload both DBS and LMS files to record one.")
+    else:
+        h1, h2, h3 = st.columns(3)
+        start = h1.date_input("From", value=max(dates[0], dates[-1] - timedelta(days=90)), key="hist_from")
+        end = h2.date_input("To", value=dates[-1], key="hist_to")
+        funders = funder_format[["Funder list", "Currency"]].dropna().astype(str).agg(" / ".join, axis=1).tolist()
+        pick = h3.selectbox("Funder / Currency", ["All"] + funders, key="hist_funder")
+
+        st.subheader("Differences first seen")
+        st.dataframe(balance_store.difference_onsets(start, end), hide_index=True)
+
+        if pick != "All":
+            funder, currency = pick.split(" / ", 1)
+            history = balance_store.balance_history(start, end, funder, currency)
+            st.subheader(f"Trend — {pick}")
+            st.line_chart(history.set_index("Date")[["LMS Amt", "Bank record"]])
+            st.dataframe(history, hide_index=True)
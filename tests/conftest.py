@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 页面和 utils 都按仓库根目录导入（streamlit run 的工作目录），测试同样把根目录放到最前
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,112 @@
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import ROOT
+from test_textbreakdown import lms_text
+from utils import batch_cli, rate_store
+from utils.textbreakdown import parse_lms_batch
+
+TODAY = "2026-01-02"
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("rates") / "rates.sqlite")
+    rate_store.connect(path, seed_csv=os.path.join(ROOT, "Tadata/updated_df.csv")).close()
+    return path
+
+
+@pytest.fixture(scope="module")
+def trades():
+    import random
+    rnd = random.Random(21)
+    texts = [lms_text(rnd, i) for i in range(40)]
+    return parse_lms_batch("\n".join(texts))
+
+
+@pytest.fixture(scope="module")
+def expected(db, trades):
+    return batch_cli.run_batch(trades, rate_store.load_rate_index(db), TODAY, "ops")
+
+
+def assert_same(got, want):
+    for g, w in zip(got, want):
+        pd.testing.assert_frame_equal(g, w, check_dtype=False)
+
+
+def test_chunk_trades():
+    df = pd.DataFrame({"x": range(10)})
+    assert [len(c) for c in batch_cli.chunk_trades(df, 4)] == [4, 4, 2]
+    with pytest.raises(ValueError):
+        batch_cli.chunk_trades(df, 0)
+
+
+def test_sharded_matches_batch(db, trades, expected):
+    got = batch_cli.run_sharded(trades, db, today=TODAY, maker_name="ops", workers=2, chunk_size=7)
+    assert_same(got, expected)
+
+
+def test_checkpoint_resume_and_cleanup(db, trades, expected, tmp_path):
+    ck = str(tmp_path / "ck")
+    batch_cli.run_sharded(trades, db, today=TODAY, maker_name="ops", workers=1, checkpoint=ck, chunk_size=9)
+    files = sorted(os.listdir(ck))
+    assert len(files) == 10   # 5 个分片 × (maker, detail)
+
+    # 删掉一个分片、损坏一个分片：只重算这两个，结果不变
+    os.remove(os.path.join(ck, files[1]))
+    with open(os.path.join(ck, files[5]), "wb") as f:
+        f.write(b"not parquet")
+    # 目录里的其他文件既不会被读取，也不会被清理删除
+    with open(os.path.join(ck, "notes.pkl"), "wb") as f:
+        f.write(b"foreign")
+    logs = []
+    got = batch_cli.run_sharded(trades, db, today=TODAY, maker_name="ops", workers=1, checkpoint=ck,
+                                chunk_size=9, log=logs.append)
+    assert logs[0] == "5 shard(s): 3 from checkpoint, 2 to run"
+    assert_same(got, expected)
+
+    assert batch_cli.clear_checkpoint(ck) == 10
+    assert os.listdir(ck) == ["notes.pkl"]
+
+
+def test_cli_removes_checkpoint_after_output(db, trades, tmp_path):
+    src = tmp_path / "trades.txt"
+    import random
+    rnd = random.Random(21)
+    src.write_text("\n".join(lms_text(rnd, i) for i in range(12)))
+    ck, out = tmp_path / "ck", tmp_path / "out.xlsx"
+    batch_cli.main([str(src), "-o", str(out), "--db", db, "--date", TODAY, "-j", "1",
+                    "--checkpoint", str(ck), "--chunk-size", "5"])
+    assert out.exists()
+    assert not ck.exists()
+    maker = pd.read_excel(out, sheet_name="Maker")
+    assert len(maker) == 12 and maker["Note"].str.startswith("Rate v").all()
+
+
+def test_checkpoint_mixed_type_columns(db, trades, tmp_path):
+    # 表格输入的文本列常混着数字和空值：检查点照常写出，续跑读回的结果与首次一致
+    mixed = trades.astype({"intmethod": object, "drawdown_id": object})
+    mixed.loc[0, "intmethod"] = 3.5
+    mixed.loc[1, "intmethod"] = float("nan")
+    mixed.loc[2, "drawdown_id"] = 12345
+    ck = str(tmp_path / "ck")
+    first = batch_cli.run_sharded(mixed, db, today=TODAY, maker_name="ops", workers=1, checkpoint=ck, chunk_size=9)
+    logs = []
+    again = batch_cli.run_sharded(mixed, db, today=TODAY, maker_name="ops", workers=1, checkpoint=ck,
+                                  chunk_size=9, log=logs.append)
+    assert logs[0] == "5 shard(s): 5 from checkpoint, 0 to run"
+    assert_same(again, first)
+    detail = first[1]
+    assert detail["intmethod"].iloc[:2].tolist() == ["3.5", ""]   # 空值按 defaults 补成 ""
+    assert detail["drawdown_id"].iloc[2] == "12345"
+
+
+def test_sharded_uses_shared_rate_snapshot(db, trades, monkeypatch):
+    calls = []
+    shared = rate_store.shared_rate_index
+    monkeypatch.setattr(rate_store, "shared_rate_index", lambda v, p=rate_store.DB_PATH: calls.append(v) or shared(v, p))
+    monkeypatch.setattr(rate_store, "load_rate_index", None)   # 不应再从库重建
+    batch_cli.run_sharded(trades.iloc[:5], db, today=TODAY, workers=1)
+    assert calls == [1]
@@ -0,0 +1,164 @@
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.csv_validation import (
+    ACCOUNT_2685, ACCOUNT_2691, FUNDER_ACCOUNT_MAP, build_lines, clean_types, generate_transfers_full,
+    match_by_amount, match_postings, match_status, match_status_counts, parse_amount_relaxed, parse_csv_by_letters,
+    parse_rows_no_header, reconcile_by_letter_columns,
+)
+
+APPROVAL = "\n".join([
+    "M-AB-12345\tRepayment\tFP0053\tUSD\t1,000.00\t10.50\t0\t5.00\t1015.50",
+    "M-AB-22222\tRepayment\tFP0057\tHKD\t0\t0\t0\t-3.00\t-3.00",
+    "M-AB-X\tRepayment\tFP0053\tUSD\t50\t0\t0\t0\t50",
+    "M-AB-33333\tRepayment\tFP0099\tUSD\t20\t0\t0\t0\t20",
+    "M-AB-44444\tRepayment\tFP0056\t\t20\t0\t0\t0\t20",
+])
+
+
+@pytest.fixture
+def transfers():
+    df = clean_types(parse_rows_no_header(APPROVAL))
+    return generate_transfers_full(build_lines(df, mmdd="1017"))
+
+
+def test_build_lines_and_routing(transfers):
+    assert transfers["Posting"].tolist() == [
+        "RPTXX12345011017", "INTSP12345011017", "INTSP22222011017", "", "RPTXX33333011017", "RPTXX44444011017",
+    ]
+    ok = transfers.loc[transfers["Valid"]]
+    assert ok["Amount"].tolist() == [1010.5, 5.0, 3.0]
+    assert ok["DebitAccount"].tolist() == [ACCOUNT_2691, ACCOUNT_2691, ACCOUNT_2685]
+    assert ok["CreditAccount"].tolist() == [FUNDER_ACCOUNT_MAP["FP0053"], ACCOUNT_2685, ACCOUNT_2691]
+
+    bad = transfers.loc[~transfers["Valid"], "Issue"].tolist()
+    assert bad == [
+        "CODE missing (Trade Code must end with 5 digits)",
+        "Funder FP0099 not mapped",
+        "Missing Currency",
+    ]
+
+
+def test_parse_amount_relaxed():
+    raw = pd.Series(["1,234.56", "USD 12.5", "(1,000.00)", "$3", "", "abc", "-4.2", ".5", None])
+    got = parse_amount_relaxed(raw).tolist()
+    expected = [1234.56, 12.5, -1000.0, 3.0, np.nan, np.nan, -4.2, 0.5, np.nan]
+    assert np.allclose(got, expected, equal_nan=True)
+
+
+def csv_row(debit="", ccy="", posting="", credit="", amount="", trade=""):
+    row = [""] * 40
+    row[2], row[3], row[4], row[15], row[27], row[35] = debit, ccy, posting, credit, amount, trade
+    return row
+
+
+def csv_bytes(rows) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue().encode("utf-8")
+
+
+def test_parse_csv_by_letters_streaming():
+    rows = [
+        csv_row("Debit", "Ccy", "Reference", "Credit", "Amount", "Trade"),
+        csv_row(ACCOUNT_2691, "USD", " RPTXX12345011017XYZ ", "001302895", "1,010.50", "M-AB-12345"),
+        [],
+        ["short", "row"],
+        csv_row(ACCOUNT_2685, "HKD", "INTSP22222011017", ACCOUNT_2691, "(3.00)"),
+    ]
+    data = csv_bytes(rows)
+    view = parse_csv_by_letters(io.BytesIO(data))
+    assert view["CSV_RowIndex"].tolist() == [0, 1, 3, 4]   # 空行跳过但计入行号
+    assert view["CSV_Key_E10"].tolist() == ["Reference", "RPTXX12345", "", "INTSP22222"]
+    assert view["CSV_Debit"].tolist() == ["Debit", ACCOUNT_2691, "", ACCOUNT_2685]
+    assert np.allclose(view["CSV_Amount"], [np.nan, 1010.5, np.nan, -3.0], equal_nan=True)
+    # 分块大小不影响结果
+    pd.testing.assert_frame_equal(view, parse_csv_by_letters(io.BytesIO(data), chunksize=1))
+
+
+def test_match_status_priority():
+    merged = pd.DataFrame({
+        "DebitAccount": ["a", "a", "a", "a", "a", "a"],
+        "CSV_Debit": [None, "a", "x", "x", "a", "a"],
+        "CreditAccount": ["b", "b", "b", "b", "b", "b"],
+        "CSV_Credit": [None, "b", "b", "y", "b", "b"],
+        "Currency": ["USD"] * 6,
+        "CSV_Currency": [None, "USD", "USD", "USD", "HKD", "USD"],
+        "Amount": [1.0, 1.0, 1.0, 1.0, 1.0, 1.0],
+        "CSV_Amount": [np.nan, 1.005, 1.0, 1.0, 1.0, 1.5],
+    })
+    assert match_status(merged).tolist() == [
+        "MISSING_IN_CSV", "OK", "ACCOUNT_DEBIT_MISMATCH", "ACCOUNT_DEBIT_MISMATCH", "CURRENCY_MISMATCH",
+        "AMOUNT_MISMATCH",
+    ]
+
+
+def test_reconcile_one_to_one(transfers):
+    view = transfers[["Trade Code Raw", "Posting", "Currency", "Amount", "DebitAccount", "CreditAccount", "Valid"]]
+    rows = [
+        csv_row("Debit", "Ccy", "Reference", "Credit", "Amount"),                              # 表头：无金额，不列出
+        csv_row(ACCOUNT_2691, "USD", "RPTXX12345011017", "001302895", "1,000.50"),             # 金额不符的重复行
+        csv_row(ACCOUNT_2691, "USD", "RPTXX12345011017", "001302895", "1,010.50"),             # 正确行
+        csv_row(ACCOUNT_2691, "USD", "INTSP12345011017", ACCOUNT_2685, "5.00"),
+        csv_row(ACCOUNT_2685, "HKD", "INTSP2222X011017", ACCOUNT_2691, "3.00"),                # 参考号录错
+        csv_row(ACCOUNT_2691, "USD", "RPTXX99999011017", "001302895", "77.00"),                # 对不上任何转账
+    ]
+    csv_view = parse_csv_by_letters(io.BytesIO(csv_bytes(rows)))
+    result = reconcile_by_letter_columns(view, csv_view)
+
+    n = len(view)
+    assert result["MatchStatus"].iloc[:n].tolist() == [
+        "OK", "OK", "KEY_MISMATCH", "MISSING_IN_CSV", "MISSING_IN_CSV", "MISSING_IN_CSV",
+    ]
+    # 每行 CSV 最多用一次：正确行给了转账，金额不符的同 key 行记为重复
+    assert result["CSV_RowIndex"].iloc[:3].tolist() == [2, 3, 4]
+    extra = result.iloc[n:]
+    assert extra["MatchStatus"].tolist() == ["DUPLICATE_IN_CSV", "UNMATCHED_CSV"]
+    assert extra["CSV_RowIndex"].tolist() == [1, 5]
+
+    counts = match_status_counts(result).set_index("MatchStatus")["Count"]
+    assert counts["OK"] == 2 and counts["AMOUNT_MISMATCH"] == 0
+    assert counts.sum() == len(result)
+
+    strict = reconcile_by_letter_columns(view, csv_view, amount_fallback=False)
+    assert strict["MatchStatus"].iloc[2] == "MISSING_IN_CSV"
+    assert (strict["MatchStatus"] == "UNMATCHED_CSV").sum() == 2
+
+
+def test_match_postings_repeated_key():
+    # 同一个 key 重复上千次（如 CSV 整批重发）：不展开全部组合，逐笔一对一
+    rng = np.random.default_rng(14)
+    k = 1500
+    amounts = rng.choice([10.0, 20.0, 30.0], k)
+    tf = pd.DataFrame({"PostingKey": ["RPTXX12345"] * k, "Currency": ["USD"] * (k - 1) + ["HKD"], "Amount": amounts})
+    order = rng.permutation(k + 5)
+    csv_amounts = np.concatenate([amounts[:-1], [amounts[-1] + 0.004], [55.0] * 5])[order]
+    csv_ccy = np.array(["USD"] * (k - 1) + ["HKD"] + ["USD"] * 5)[order]
+    csv_view = pd.DataFrame({"CSV_Key_E10": ["RPTXX12345"] * (k + 5), "CSV_Currency": csv_ccy, "CSV_Amount": csv_amounts})
+
+    match = match_postings(tf, csv_view)
+    assert (match >= 0).all()
+    assert len(np.unique(match)) == k                       # 每行 CSV 最多用一次
+    assert np.allclose(csv_view["CSV_Amount"].to_numpy()[match], amounts, atol=0.01)
+    assert (csv_view["CSV_Currency"].to_numpy()[match] == tf["Currency"].to_numpy()).all()
+    # 金额相同时取行号小的 CSV 行
+    same = amounts[:-1] == 10.0
+    assert match[:-1][same].min() == np.flatnonzero((csv_amounts == 10.0) & (csv_ccy == "USD")).min()
+
+
+def test_match_by_amount_many_equal_amounts():
+    # 大量同币种同金额的剩余行：一对一配完，且优先配借贷账户一致的 CSV 行
+    k = 800
+    tf = pd.DataFrame({"Currency": ["USD"] * k, "Amount": [100.0] * k,
+                       "DebitAccount": ["a"] * k, "CreditAccount": ["b"] * (k - 1) + ["z"]})
+    csv_view = pd.DataFrame({"CSV_Currency": ["USD"] * (k + 2), "CSV_Amount": [100.0] * k + [100.005, 99.0],
+                             "CSV_Debit": ["x"] + ["a"] * (k + 1), "CSV_Credit": ["y"] + ["b"] * (k - 1) + ["z", "b"]})
+    match = match_by_amount(tf, csv_view, np.arange(k), np.arange(k + 2))
+    assert (match >= 0).all()
+    assert len(np.unique(match)) == k
+    assert 0 not in match and k + 1 not in match   # 账户都不一致 / 超出金额容差
+    assert match[-1] == k                           # 贷方 z 配贷方 z 的那一行
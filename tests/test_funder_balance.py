@@ -0,0 +1,43 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils import funder_balance
+
+
+def test_fill_balances_by_index():
+    funder_format = pd.DataFrame({
+        "Funder list": ["FP0053", "FP0057", "FP0099"], "Currency": ["USD", "HKD", "USD"],
+        "Account no.": ["001302895", " 001302931", "x"], "LMS Amt": [None] * 3, "Bank record": [None] * 3,
+    })
+    bank = funder_balance._indexed(pd.DataFrame({
+        "Account Number": ["001302895", "001302931", "001302895"], "Currency": ["USD", "HKD", "USD"],
+        "Available Balance": [10.0, 20.0, 99.0],
+    }), funder_balance.DBS_COLUMNS)
+    lms = funder_balance._indexed(pd.DataFrame({
+        "Funder ID": ["FP0053"], "Currency": ["USD"], "Ledger Balance": [11.0],
+    }), funder_balance.LMS_COLUMNS)
+    out = funder_balance.fill_balances(funder_format, bank, lms)
+    assert out["Bank record"].tolist()[:2] == [10.0, 20.0]      # 重复账户取第一行；账号去空白后匹配
+    assert pd.isna(out["Bank record"].iloc[2])
+    assert out["LMS Amt"].iloc[0] == 11.0 and out["LMS Amt"].iloc[1:].isna().all()
+    assert len(out) == len(funder_format)
+
+
+class Upload(io.BytesIO):
+    pass
+
+
+def test_upload_cache_concurrent(monkeypatch):
+    monkeypatch.setattr(funder_balance, "_upload_cache", type(funder_balance._upload_cache)())
+    monkeypatch.setattr(funder_balance, "_UPLOAD_CACHE_SIZE", 3)
+
+    def parse(data: bytes) -> pd.Series:
+        return pd.Series([len(data)])
+
+    uploads = [Upload(bytes([i]) * (i + 1)) for i in range(8)]
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda u: funder_balance._cached("dbs", u, parse), uploads * 25))
+    assert [int(r.iloc[0]) for r in results] == [i + 1 for i in range(8)] * 25
+    assert len(funder_balance._upload_cache) <= 3
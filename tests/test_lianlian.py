@@ -0,0 +1,118 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+msoffcrypto = pytest.importorskip("msoffcrypto")
+from msoffcrypto.format.ooxml import OOXMLFile
+
+from utils import lianlian
+
+
+def make_workbook(sheets: int = 3, rows: int = 50, seed: int = 0) -> bytes:
+    """加密的连连工作簿：Summary + Deduction + 若干四位数字交易表 + 一张无关表"""
+    rng = np.random.default_rng(seed)
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as w:
+        pd.DataFrame({"Company Name": ["A", "B"], "Deduction Amount": [1.5, 2.5],
+                      "Deduction Date": ["2024-01-01", "2024-01-02"]}).to_excel(w, sheet_name="Summary", index=False)
+        pd.DataFrame({"x": [1]}).to_excel(w, sheet_name="Deduction", index=False)
+        for i in range(sheets):
+            trunc = rng.integers(0, 10000, rows) / 100
+            trunc[::7] = np.nan
+            pd.DataFrame({
+                "Seller Name": rng.choice(list("XYZ"), rows), "Trade Code": [f"T{seed}{i}{j}" for j in range(rows)],
+                "Settle": ["2024-01-01"] * rows, "TRUNC P": trunc, "Repaid Loan P": rng.integers(0, 1000, rows) / 100,
+                "Other": range(rows),
+            }).to_excel(w, sheet_name=f"{1001 + i}", index=False)
+        pd.DataFrame({"x": [1]}).to_excel(w, sheet_name="Notes", index=False)
+    buf.seek(0)
+    out = io.BytesIO()
+    OOXMLFile(buf).encrypt(lianlian.LIANLIAN_PASSWORD, out)
+    return out.getvalue()
+
+
+def expected_trades(data: bytes) -> pd.DataFrame:
+    # 对照：整本读入后逐表筛选（改造前页面的做法）
+    sheets = pd.read_excel(io.BytesIO(lianlian.decrypt_workbook(data)), sheet_name=None)
+    frames = []
+    for name, df in sheets.items():
+        if lianlian.is_trade_sheet(name):
+            df = df[df["TRUNC P"].notna() & df["Repaid Loan P"].notna()]
+            frames.append(df[lianlian.TRADE_COLUMNS].assign(**{"Sheet Name": name}))
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(lianlian, "_lianlian_cache", type(lianlian._lianlian_cache)())
+    monkeypatch.setattr(lianlian, "_lianlian_cache_used", 0)
+
+
+def test_load_lianlian_reads_needed_sheets():
+    data = make_workbook()
+    parsed = lianlian.load_lianlian(data)
+    assert parsed["sheet_names"] == ["Summary", "Deduction", "1001", "1002", "1003", "Notes"]
+    assert parsed["deduction"]["Deduction Amount"].tolist() == [1.5, 2.5]
+    pd.testing.assert_frame_equal(parsed["trades"], expected_trades(data), check_dtype=False)
+
+    # 返回副本：改动不影响缓存
+    parsed["trades"].loc[0, "TRUNC P"] = -1
+    assert lianlian.load_lianlian(data)["trades"].loc[0, "TRUNC P"] != -1
+
+
+def test_cache_budget_concurrent(monkeypatch):
+    datas = [make_workbook(sheets=1, rows=20, seed=s) for s in range(4)]
+    lianlian.load_lianlian(datas[0])
+    (size,) = [v[2] for v in lianlian._lianlian_cache.values()]
+    # 上限只够放两个：多个线程交替读取时持续淘汰，计数必须与缓存内容一致
+    monkeypatch.setattr(lianlian, "_LIANLIAN_CACHE_BYTES", int(size * 2.5))
+    with ThreadPoolExecutor(6) as pool:
+        results = list(pool.map(lianlian.load_lianlian, datas * 5))
+    assert all(len(r["trades"]) for r in results)
+    cached = lianlian._lianlian_cache
+    assert 1 <= len(cached) <= 2
+    assert lianlian._lianlian_cache_used == sum(v[2] for v in cached.values())
+
+
+def test_batch_merges_files_and_skips_duplicates():
+    a, b = make_workbook(seed=1), make_workbook(seed=2)
+    merged, files = lianlian.load_lianlian_batch([a, b, a, b"not a workbook"])
+    assert files["Trades"].tolist()[:2] == [len(expected_trades(a)), len(expected_trades(b))]
+    assert files["Error"].iloc[2].startswith("Same content as")
+    assert files["Error"].iloc[3] != ""
+    assert len(merged) == files["Trades"].sum()
+
+
+def test_batch_process_pool_matches_serial(monkeypatch):
+    datas = [make_workbook(sheets=2, rows=30, seed=s) for s in (5, 6, 7)]
+    monkeypatch.setattr(lianlian, "_lianlian_cache", type(lianlian._lianlian_cache)())
+    monkeypatch.setattr(lianlian, "_lianlian_cache_used", 0)
+    pooled, pooled_files = lianlian.load_lianlian_batch(datas + [b"not a workbook"], workers=2)
+    assert pooled_files["Error"].tolist()[:3] == ["", "", ""] and pooled_files["Error"].iloc[3] != ""
+    assert len(lianlian._lianlian_cache) == 3   # 进程池读出的结果放回缓存
+
+    lianlian._lianlian_cache.clear()
+    serial, serial_files = lianlian.load_lianlian_batch(datas, workers=1)
+    pd.testing.assert_frame_equal(pooled, serial)
+    pd.testing.assert_frame_equal(pooled_files.iloc[:3], serial_files)
+
+def test_seller_totals_keeps_same_named_files_apart(tmp_path):
+    paths = []
+    for i, seed in enumerate((3, 4)):
+        folder = tmp_path / f"m{i}"
+        folder.mkdir()
+        path = folder / "lianlian.xlsx"
+        path.write_bytes(make_workbook(seed=seed))
+        paths.append(str(path))
+    merged, files = lianlian.load_lianlian_batch(paths)
+    assert files["File"].tolist() == ["lianlian.xlsx", "lianlian.xlsx (2)"]
+
+    totals = lianlian.seller_totals(merged)
+    assert list(totals.columns) == ["Seller Name", "lianlian.xlsx", "lianlian.xlsx (2)", "Total"]
+    for label, path in zip(files["File"], paths):
+        expected = expected_trades(open(path, "rb").read()).groupby("Seller Name")["TRUNC P"].sum()
+        got = totals.set_index("Seller Name")[label]
+        assert got.reindex(expected.index).to_numpy() == pytest.approx(expected.to_numpy())
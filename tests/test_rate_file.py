@@ -0,0 +1,69 @@
+import json
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from conftest import ROOT
+from utils import rate_store
+from utils.rate_file import MAGIC, open_rate_file, rate_file_path
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "rates.sqlite")
+    rate_store.connect(path, seed_csv=os.path.join(ROOT, "Tadata/updated_df.csv")).close()
+    rate_store._shared_rate_index.cache_clear()
+    yield path
+    rate_store._shared_rate_index.cache_clear()
+
+
+def _truncate(path):
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) // 2)
+
+
+def _garbage(path):
+    with open(path, "wb") as f:
+        f.write(b"PK\x03\x04 not a rate file")
+
+
+def _bad_json(path):
+    raw = b'{"base": 1, "size": '
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(raw)) + raw)
+
+
+def _bad_layout(path):
+    # 头能解析，但声明的数组长度远超文件大小
+    raw = json.dumps({"base": 1, "size": 10 ** 9, "version": 1, "columns": [], "scale": 10 ** 8,
+                      "arrays": {"missing": [0, "|b1", 10 ** 9], "days": [0, "<i8", 10 ** 9 + 1]}}).encode()
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(raw)) + raw)
+
+
+@pytest.mark.parametrize("damage", [_truncate, _garbage, _bad_json, _bad_layout])
+def test_bad_snapshot_is_rejected_and_republished(db, damage):
+    expected = rate_store.load_rate_index(db, 1)
+    path = rate_store.publish_rate_file(1, db)
+    damage(path)
+    with pytest.raises(ValueError):
+        open_rate_file(path)
+
+    got = rate_store.shared_rate_index(1, db)
+    assert got.version == 1 and got.size == expected.size
+    for col in expected.columns:
+        np.testing.assert_array_equal(got._cum[col], expected._cum[col])
+    open_rate_file(path)   # 已重新发布为完好的快照
+
+
+def test_unwritable_snapshot_falls_back_to_db(db, monkeypatch):
+    path = rate_file_path(db, 1)
+    _garbage(path)
+
+    def fail(version, db_path):
+        raise OSError("read-only")
+    monkeypatch.setattr(rate_store, "publish_rate_file", fail)
+    got = rate_store.shared_rate_index(1, db)
+    assert got.version == 1 and got.size == rate_store.load_rate_index(db, 1).size
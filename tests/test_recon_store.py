@@ -0,0 +1,70 @@
+import io
+from datetime import date
+
+from test_csv_validation import csv_bytes, csv_row
+from utils import recon_store
+from utils.archive_recon import file_date
+from utils.csv_validation import (
+    ACCOUNT_2691, build_lines, clean_types, generate_transfers_full, parse_csv_by_letters, parse_rows_no_header,
+    reconcile_by_letter_columns,
+)
+
+VIEW_COLUMNS = ["Trade Code Raw", "Posting", "Currency", "Amount", "DebitAccount", "CreditAccount", "Valid"]
+
+
+def reconcile(approval: str, rows: list, mmdd: str):
+    transfers = generate_transfers_full(build_lines(clean_types(parse_rows_no_header(approval)), mmdd=mmdd))
+    return reconcile_by_letter_columns(transfers[VIEW_COLUMNS], parse_csv_by_letters(io.BytesIO(csv_bytes(rows))))
+
+
+def test_file_date():
+    assert file_date("DBS_20251017.csv") == date(2025, 10, 17)
+    assert file_date("dbs-2025-10-17-final.csv") == date(2025, 10, 17)
+    assert file_date("dbs_export.csv") is None
+
+
+def test_paid_before_uses_file_dates(tmp_path):
+    db = str(tmp_path / "recon.sqlite")
+    approval = "M-AB-12345\tRepayment\tFP0053\tUSD\t100\t0\t0\t0\t100"
+    paid = [csv_row(ACCOUNT_2691, "USD", "RPTXX12345011016", "001302895", "100.00", "M-AB-12345")]
+
+    # 补跑 10/16 的文件：按文件日期入库，之后 10/17 再出现同一笔时标记为已付
+    day1 = file_date("DBS_20251016.csv")
+    first = recon_store.flag_prior_settled(reconcile(approval, paid, "1016"), day1, db)
+    assert first["PaidBefore"].isna().all()
+    recon_store.record_run(first, day1, "DBS_20251016.csv", db)
+
+    day2 = file_date("DBS_20251017.csv")
+    second = recon_store.flag_prior_settled(reconcile(approval, [], "1017"), day2, db)
+    assert second["PaidBefore"].iloc[0] == day1
+
+    # 同一天重跑不算“更早”
+    again = recon_store.flag_prior_settled(reconcile(approval, paid, "1016"), day1, db)
+    assert again["PaidBefore"].isna().all()
+
+
+def test_archive_records_each_day(tmp_path):
+    from utils.archive_recon import reconcile_archive
+
+    folder = tmp_path / "archive"
+    folder.mkdir()
+    approval = "M-AB-12345\tRepayment\tFP0053\tUSD\t100\t0\t0\t0\t100"
+    for day in ("20251016", "20251017"):
+        (folder / f"approval_{day}.txt").write_text(approval)
+        row = csv_row(ACCOUNT_2691, "USD", f"RPTXX1234501{day[4:]}", "001302895", "100.00", "M-AB-12345")
+        (folder / f"DBS_{day}.csv").write_bytes(csv_bytes([row]))
+
+    db = str(tmp_path / "recon.sqlite")
+    results, summary, unpaired = reconcile_archive(str(folder), history_db=db)
+    assert unpaired == [] and (summary["Error"] == "").all()
+    assert summary["OK"].tolist() == [1, 1]
+    # 按文件日期逐日写入：第二天的同一笔在第一天的 DBS 文件里已出现
+    assert summary["PaidBefore"].tolist() == [0, 1]
+
+    conn = recon_store.connect(db)
+    try:
+        runs = conn.execute("SELECT DISTINCT run_date, source FROM csv_rows ORDER BY 1").fetchall()
+    finally:
+        conn.close()
+    assert runs == [(date(2025, 10, 16).toordinal(), "DBS_20251016.csv"),
+                    (date(2025, 10, 17).toordinal(), "DBS_20251017.csv")]
@@ -0,0 +1,134 @@
+import math
+import random
+
+import pandas as pd
+import pytest
+
+from utils.dic_data import defaults
+from utils.textbreakdown import parse_lms_to_dic, parse_lms_fast, parse_lms_batch
+
+
+def lms_text(rnd: random.Random, i: int, title_tail: str = "") -> str:
+    """一笔 LMS 粘贴文本；title_tail 追加在每个段落标题行尾（模拟粘贴带出的空格）"""
+    t = title_tail
+    return f"""Payment Details{t}
+Drawdown ID\tM-ABC-{10000 + i}
+Repayment ID\tRP{i}
+Repayment Currency\t{rnd.choice(['USD', 'HKD'])}
+SME Disbursement Date\t{rnd.randint(1, 28):02d}/0{rnd.randint(1, 9)}/2025
+Repayment Date\t15/10/2025
+Repayment Amount\t{rnd.randint(1000, 99999):,}.50
+Bank Charge\t10.00
+SME Information{t}
+Tenor\t90 Days
+MIT (Days)\t{rnd.choice([7, 15])}
+Interest Rate (% p.a.)\tSOFR + {rnd.choice([3, 4.5])}
+SME Transaction{t}
+Outstanding Principal\t100,000.00
+Interest\t1,234.56
+Overdue Interest\t
+Return To Borrower\t0.00
+Waive Items{t}
+Bank Charge\t{rnd.choice(['10.00', '(5.00)', ''])}
+Interest\t3.2
+Surcharge Items{t}
+Late Fee\t12.50
+Admin\tN/A
+Other\t(2.00)
+Funder Information{t}
+Funder ID\tFP0057
+Funder Disbursement Date\t02/07/2025
+Last Funder Submission Date\t
+Funder Transaction{t}
+Principal\t100,000.00
+Interest (I + OI)\t1,100.00
+Interest Rate (% p.a.)\t{rnd.choice(['0', '8.5'])}
+Platform Fee\t11.00
+Total Allocation\t101,100.00
+FundPark Transaction{t}
+FundPark Spreading\t134.56
+"""
+
+
+def _same(a, b) -> bool:
+    if a is None or b is None:
+        return a is b
+    if isinstance(a, float) and math.isnan(a):
+        return isinstance(b, float) and math.isnan(b)
+    return a == b
+
+
+def _diff(expected: dict, actual: dict) -> list:
+    assert set(expected) == set(actual)
+    return [k for k in expected if not _same(expected[k], actual[k])]
+
+
+@pytest.mark.parametrize("tail", ["", " ", "  "])
+def test_parse_lms_fast_matches_baseline(tail):
+    rnd = random.Random(3)
+    for i in range(20):
+        text = lms_text(rnd, i, tail)
+        assert _diff(parse_lms_to_dic(text), parse_lms_fast(text)) == []
+
+
+def test_trailing_space_titles_keep_sections():
+    # 标题行尾带空格时段落不能丢：Funder Transaction 下的利率和平台费仍要取到
+    text = lms_text(random.Random(5), 0, " ")
+    fast = parse_lms_fast(text)
+    assert fast == parse_lms_fast(text.replace(" \n", "\n"))
+    assert fast["platform_fee"] == -11.0
+    assert fast["principal"] == 100000.0
+    assert fast["spreading_sysint"] == 134.56
+
+
+def test_crlf_titles():
+    # Windows 粘贴带 \r\n：基线正则认不出这种标题，快速解析按去掉行尾空白后的标题处理
+    rnd = random.Random(9)
+    text = lms_text(rnd, 0)
+    assert parse_lms_fast(text.replace("\n", "\r\n")) == parse_lms_fast(text)
+
+
+def test_parse_lms_fast_returns_copy():
+    text = lms_text(random.Random(7), 1)
+    first = parse_lms_fast(text)
+    first["drawdown_id"] = "changed"
+    assert parse_lms_fast(text)["drawdown_id"] == parse_lms_to_dic(text)["drawdown_id"]
+
+
+@pytest.mark.parametrize("tail", ["", " "])
+def test_parse_lms_batch_matches_baseline(tail):
+    rnd = random.Random(11)
+    texts = [lms_text(rnd, i, tail) for i in range(15)]
+    df = parse_lms_batch("\n".join(texts))
+    assert len(df) == len(texts)
+    for text, (_, row) in zip(texts, df.iterrows()):
+        expected = parse_lms_to_dic(text)
+        for k, v in expected.items():
+            got = row[k]
+            if isinstance(defaults[k], int):
+                # 批量结果的天数列为 Int64：基线的字符串值按同样规则转成数字再比较
+                v = pd.to_numeric(pd.Series([v]), errors="coerce").iloc[0]
+            if v is None or (isinstance(v, float) and math.isnan(v)):
+                assert pd.isna(got), k
+            elif isinstance(got, pd.Timestamp):
+                assert got.date() == v, k
+            elif isinstance(v, (int, float)):
+                assert got == pytest.approx(v), k
+            else:
+                assert str(got) == str(v), k
+
+
+def test_parse_lms_fast_concurrent(monkeypatch):
+    # 多个会话线程同时读写缓存（缓存容量小于文本数，持续淘汰）
+    from concurrent.futures import ThreadPoolExecutor
+    from utils import textbreakdown
+
+    monkeypatch.setattr(textbreakdown, "_LMS_CACHE_SIZE", 4)
+    rnd = random.Random(13)
+    texts = [lms_text(rnd, i) for i in range(12)]
+    expected = [parse_lms_to_dic(t) for t in texts]
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(parse_lms_fast, texts * 20))
+    for k, got in enumerate(results):
+        assert _diff(expected[k % len(texts)], got) == []
+    assert len(textbreakdown._lms_cache) <= 4
@@ -0,0 +1,157 @@
+import os
+import re
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import pandas as pd
+
+from utils import recon_store
+from utils.csv_validation import (
+    parse_rows_no_header, clean_types, build_lines, generate_transfers_full,
+    parse_csv_by_letters, reconcile_by_letter_columns, match_status_counts,
+)
+
+# 归档对账：一个文件夹里有每天的 Approval 导出（无表头 TSV/CSV，与页面粘贴格式相同）和 DBS CSV，
+# 按文件名中的日期配对，每天一个任务（CLI 放进进程池，页面串行），最后合并成一张结果表和一张汇总表
+DATE_PATTERN = re.compile(r"(20\d{2})[-_]?(\d{2})[-_]?(\d{2})")
+APPROVAL_EXTS = (".txt", ".tsv", ".csv")
+VIEW_COLUMNS = ["Trade Code Raw", "Posting", "Currency", "Amount", "DebitAccount", "CreditAccount", "Valid"]
+
+
+def file_date(name: str):
+    """文件名中的日期（YYYYMMDD / YYYY-MM-DD / YYYY_MM_DD），没有则为 None"""
+    m = DATE_PATTERN.search(os.path.basename(name))
+    if not m:
+        return None
+    try:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    except ValueError:
+        return None
+
+
+def is_dbs_csv(name: str) -> bool:
+    base = os.path.basename(name).lower()
+    return base.endswith(".csv") and "dbs" in base
+
+
+def pair_archive_files(folder: str) -> tuple:
+    """
+    按日期配对：返回 ([(日期, [Approval 文件], [DBS CSV 文件]), ...], [无法配对的文件])。
+    文件名含 "dbs" 的 .csv 视为 DBS CSV，其余 .txt/.tsv/.csv 视为 Approval 导出。
+    """
+    approvals, csvs, unpaired = defaultdict(list), defaultdict(list), []
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            d = file_date(name)
+            if d is None or not name.lower().endswith(APPROVAL_EXTS):
+                unpaired.append(path)
+            elif is_dbs_csv(name):
+                csvs[d].append(path)
+            else:
+                approvals[d].append(path)
+
+    pairs = []
+    for d in sorted(set(approvals) | set(csvs)):
+        if approvals[d] and csvs[d]:
+            pairs.append((d, approvals[d], csvs[d]))
+        else:
+            unpaired.extend(approvals[d] + csvs[d])
+    return pairs, unpaired
+
+
+def _read_text(path: str) -> str:
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        return f.read()
+
+
+def reconcile_day(task: tuple) -> tuple:
+    """
+    单日对账（进程池任务，只接收文件路径，不传大对象）：
+    Approval 文本 → 转账（MMDD 取文件日期）；DBS CSV 逐个解析后合并；再一对一对账。
+    返回 (日期, 结果表, 错误信息或 None)。
+    """
+    d, approval_files, csv_files, amount_tol = task
+    try:
+        text = "\n".join(_read_text(p) for p in approval_files)
+        lines_df = build_lines(clean_types(parse_rows_no_header(text)), mmdd=d.strftime("%m%d"))
+        transfers = generate_transfers_full(lines_df)[VIEW_COLUMNS]
+        csv_view = pd.concat([parse_csv_by_letters(p) for p in csv_files], ignore_index=True)
+        result = reconcile_by_letter_columns(transfers, csv_view, amount_tol=amount_tol)
+        result.insert(0, "Date", d)
+        return d, result, None
+    except Exception as e:
+        return d, None, f"{type(e).__name__}: {e}"
+
+
+def reconcile_archive(folder: str, amount_tol: float = 0.01, mapper=map,
+                      history_db: str = recon_store.DB_PATH) -> tuple:
+    """
+    对整个归档文件夹做对账，按日期逐日执行 reconcile_day。
+    - mapper：逐日任务的 map 函数；默认串行（页面内不开进程池），CLI 传入进程池的 pool.map
+    - history_db：每天的结果按文件日期写入对账历史库（日期从早到晚，先查更早日期的重复付款再写入）；None 时不读写
+    返回 (合并结果表, 每日汇总表, 无法配对的文件列表)；单日出错不影响其他日期，错误写在汇总表 Error 列。
+    """
+    pairs, unpaired = pair_archive_files(folder)
+    tasks = [(d, a, c, amount_tol) for d, a, c in pairs]
+    outputs = list(mapper(reconcile_day, tasks))
+
+    files = {d: (a, c) for d, a, c in pairs}
+    results, summary = [], []
+    for d, result, error in outputs:
+        row = {
+            "Date": d,
+            "Approval Files": ", ".join(os.path.basename(p) for p in files[d][0]),
+            "DBS Files": ", ".join(os.path.basename(p) for p in files[d][1]),
+            "Error": error or "",
+        }
+        if result is not None and history_db is not None:
+            # 历史库只在主进程按日期顺序写（SQLite 单写者），不放进进程池任务
+            try:
+                source = ", ".join(os.path.basename(p) for p in files[d][1])
+                result = recon_store.flag_prior_settled(result, d, history_db)
+                recon_store.record_run(result, d, source, history_db)
+            except Exception as e:
+                row["Error"] = f"History: {type(e).__name__}: {e}"
+        if result is not None:
+            results.append(result)
+            counts = match_status_counts(result)
+            row.update(zip(counts["MatchStatus"], counts["Count"]))
+            if "PaidBefore" in result:
+                row["PaidBefore"] = int(result["PaidBefore"].notna().sum())
+        summary.append(row)
+
+    results = pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+    summary = pd.DataFrame(summary)
+    status_cols = [c for c in summary.columns if c not in ("Date", "Approval Files", "DBS Files", "Error")]
+    summary[status_cols] = summary[status_cols].fillna(0).astype(int)
+    return results, summary, unpaired
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconcile a folder of approval exports against DBS CSVs.")
+    parser.add_argument("folder")
+    parser.add_argument("-o", "--output", default="archive_reconciliation.xlsx", help="xlsx output path")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--amount-tol", type=float, default=0.01)
+    parser.add_argument("--history-db", default=recon_store.DB_PATH, help="reconciliation history database")
+    parser.add_argument("--no-history", action="store_true", help="do not read or write the history database")
+    args = parser.parse_args(argv)
+
+    history_db = None if args.no_history else args.history_db
+    if args.workers == 1:
+        results, summary, unpaired = reconcile_archive(args.folder, args.amount_tol, history_db=history_db)
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            results, summary, unpaired = reconcile_archive(args.folder, args.amount_tol, pool.map, history_db)
+    with pd.ExcelWriter(args.output) as writer:
+        summary.to_excel(writer, sheet_name="Summary", index=False)
+        results.to_excel(writer, sheet_name="Results", index=False)
+    print(summary.to_string(index=False))
+    if unpaired:
+        print(f"Unpaired files ({len(unpaired)}): " + ", ".join(os.path.basename(p) for p in unpaired))
+
+
+if __name__ == "__main__":
+    main()
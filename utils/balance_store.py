@@ -0,0 +1,142 @@
+import sqlite3
+import pandas as pd
+from datetime import date
+
+from utils.rate_index import to_ordinals
+
+# Funder 余额历史库：每天一份参考表快照（LMS Amt / Bank record），用于看趋势和差异首次出现的日期
+# 日期以 date.toordinal() 整数存储，金额以“分”为整数存储
+DB_PATH = "Tadata/balance_history.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS balances (
+    snap_date  INTEGER NOT NULL,
+    funder     TEXT NOT NULL,
+    currency   TEXT NOT NULL,
+    account    TEXT,
+    lms_cents  INTEGER,
+    bank_cents INTEGER,
+    PRIMARY KEY (snap_date, funder, currency)
+);
+CREATE INDEX IF NOT EXISTS ix_balances_funder ON balances (funder, currency, snap_date);
+"""
+
+
+def _has_diff(t: str) -> str:
+    # 与页面 Difference 的判断一致：任一侧缺失或两侧不等都算差异
+    return f"({t}.lms_cents IS NULL OR {t}.bank_cents IS NULL OR {t}.lms_cents != {t}.bank_cents)"
+
+
+HISTORY_COLUMNS = ["Date", "Funder list", "Currency", "Account no.", "LMS Amt", "Bank record", "Difference"]
+
+
+def connect(db_path: str = DB_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _cents(amount: pd.Series) -> list:
+    v = pd.to_numeric(amount, errors="coerce").to_numpy(dtype=float)
+    return [None if x != x else int(round(x * 100)) for x in v]
+
+
+def _text(s: pd.Series) -> list:
+    s = s.astype("string").str.strip()
+    return s.astype(object).where(s.notna(), None).tolist()
+
+
+def record_snapshot(balances_df: pd.DataFrame, snap_date, db_path: str = DB_PATH) -> int:
+    """
+    把当天的余额表（fill_balances 的结果）写入历史库（单个事务）。同一天重复写入时整体替换。
+    返回写入的行数。
+    """
+    snap = to_ordinals(snap_date)
+    df = balances_df.loc[balances_df["Funder list"].notna() & balances_df["Currency"].notna()]
+    rows = list(zip(
+        [snap] * len(df), _text(df["Funder list"]), _text(df["Currency"]), _text(df["Account no."]),
+        _cents(df["LMS Amt"]), _cents(df["Bank record"]),
+    ))
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM balances WHERE snap_date = ?", (snap,))
+            conn.executemany("INSERT OR REPLACE INTO balances VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def _range(start, end) -> tuple:
+    lo = to_ordinals(start) if start is not None else 0
+    hi = to_ordinals(end) if end is not None else date.max.toordinal()
+    return lo, hi
+
+
+def _to_frame(rows: list) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=HISTORY_COLUMNS[:-1])
+    days = {o: date.fromordinal(o) for o in df["Date"].unique().tolist()}
+    df["Date"] = pd.Series(df["Date"].map(days), dtype=object)
+    for col in ["LMS Amt", "Bank record"]:
+        df[col] = pd.to_numeric(df[col]).astype(float) / 100
+    df["Difference"] = df["LMS Amt"] - df["Bank record"]
+    return df
+
+
+def balance_history(start=None, end=None, funder: str = None, currency: str = None,
+                    db_path: str = DB_PATH) -> pd.DataFrame:
+    """日期区间内的每日余额（可按 Funder / 币种过滤），按 Funder、币种、日期排序"""
+    lo, hi = _range(start, end)
+    sql = ("SELECT snap_date, funder, currency, account, lms_cents, bank_cents FROM balances "
+           "WHERE snap_date BETWEEN ? AND ?")
+    params = [lo, hi]
+    if funder is not None:
+        sql += " AND funder = ?"
+        params.append(funder)
+    if currency is not None:
+        sql += " AND currency = ?"
+        params.append(currency)
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(sql + " ORDER BY funder, currency, snap_date", params).fetchall()
+    finally:
+        conn.close()
+    return _to_frame(rows)
+
+
+def difference_onsets(start=None, end=None, db_path: str = DB_PATH) -> pd.DataFrame:
+    """
+    差异首次出现的日期：区间内每个 (Funder, 币种) 从无差异（或第一天）变为有差异的那些天。
+    只对有差异的行，沿 (funder, currency, snap_date) 索引取区间内前一次快照比较，返回列同 balance_history。
+    """
+    lo, hi = _range(start, end)
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(f"""
+            SELECT b.snap_date, b.funder, b.currency, b.account, b.lms_cents, b.bank_cents
+              FROM balances b
+             WHERE b.snap_date BETWEEN :lo AND :hi AND {_has_diff("b")}
+               AND NOT COALESCE((
+                   SELECT {_has_diff("p")} FROM balances p
+                    WHERE p.funder = b.funder AND p.currency = b.currency
+                      AND p.snap_date >= :lo AND p.snap_date < b.snap_date
+                    ORDER BY p.snap_date DESC LIMIT 1), 0)
+             ORDER BY b.snap_date, b.funder, b.currency
+        """, {"lo": lo, "hi": hi}).fetchall()
+    finally:
+        conn.close()
+    return _to_frame(rows)
+
+
+def snapshot_dates(db_path: str = DB_PATH) -> list:
+    conn = connect(db_path)
+    try:
+        return [date.fromordinal(o) for (o,) in conn.execute("SELECT DISTINCT snap_date FROM balances ORDER BY 1")]
+    finally:
+        conn.close()
@@ -0,0 +1,371 @@
+import os
+import re
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+import numpy as np
+import pandas as pd
+
+from utils import rate_store
+from utils.dic_data import defaults, maker_data
+from utils.interest_engine import compute_interest, rate_version_note, DATE_FIELDS
+from utils.textbreakdown import parse_lms_batch
+
+# 无界面批量跑 Data Processor：LMS 文本（或已解析的交易表）+ 利率库 → Maker 表、明细、汇总
+# 用法：python -m utils.batch_cli trades.txt -o out.xlsx [--opstype Rollover] [--maker NAME] [--rate-version N]
+#      大批量：加 -j N 分片并行（--chunk-size 每片笔数），加 --checkpoint DIR 断点续跑
+TABLE_EXTS = (".csv", ".tsv", ".xlsx", ".xls")
+OPSTYPES = ["Repayment", "Rollover"]
+OVERRIDE_COLUMNS = ["opstype", "xdj", "fundertype", "ratetype", "prdtype"]   # compute_interest 认的覆盖列
+
+
+def read_trades(path: str) -> pd.DataFrame:
+    """
+    读交易：.txt 等按 LMS 文本流式解析（parse_lms_batch）；.csv/.tsv/.xlsx 视为已解析的交易表，
+    列名同 utils.dic_data.defaults，可带 opstype / xdj / fundertype / ratetype / prdtype 覆盖列。
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in TABLE_EXTS:
+        with open(path, encoding="utf-8-sig", errors="replace") as f:
+            return parse_lms_batch(f)
+    if ext in (".xlsx", ".xls"):
+        df = pd.read_excel(path)
+    else:
+        df = pd.read_csv(path, sep="\t" if ext == ".tsv" else ",")
+    df.columns = df.columns.str.strip()
+    for k in DATE_FIELDS:
+        if k in df.columns:
+            df[k] = pd.to_datetime(df[k], errors="coerce")
+    return df
+
+
+def prepare_trades(trades: pd.DataFrame, opstype: str = "Repayment", xdj: bool = False) -> pd.DataFrame:
+    """只保留 defaults 列和覆盖列（其余列忽略），补齐缺省值，并用命令行参数补上没有逐笔指定的 opstype / 小店金"""
+    df = trades.reset_index(drop=True)
+    df = df[[c for c in [*defaults, *OVERRIDE_COLUMNS] if c in df.columns]].copy()
+    for k, v in defaults.items():
+        if k not in df.columns:
+            df[k] = v
+        else:
+            df[k] = df[k].where(df[k].notna(), v)
+    df["opstype"] = df["opstype"].fillna(opstype) if "opstype" in df else opstype
+    if "xdj" in df:
+        # 表里的 True/False、1/0、yes/no 都认
+        df["xdj"] = df["xdj"].fillna(xdj).astype(str).str.strip().str.lower().isin(["true", "1", "1.0", "yes", "y"])
+    else:
+        df["xdj"] = xdj
+    return df
+
+
+def _num(df: pd.DataFrame, col: str) -> np.ndarray:
+    return pd.to_numeric(df[col], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+
+
+def _dates(s: pd.Series) -> pd.Series:
+    return pd.to_datetime(s, errors="coerce").dt.date
+
+
+def build_maker_table(trades: pd.DataFrame, result: pd.DataFrame, today: str, maker_name: str = "") -> pd.DataFrame:
+    """
+    每笔一行 Maker 记录，列同 maker_data（Date … Checker / Note2），取值规则同页面 Output：
+    Platform Fee 用计算值；Repayment 的 Sub 为 Bank Charge，Rollover 的 Sub 为 Return to Borrower；
+    Note 记录所用利率版本。
+    """
+    is_repay = (trades["opstype"] == "Repayment").to_numpy()
+    is_roll = (trades["opstype"] == "Rollover").to_numpy()
+    principal, funder_sysint = _num(trades, "principal"), _num(trades, "funder_sysint")
+    spreading_sysint, platform_fee = _num(trades, "spreading_sysint"), result["platform_fee"].to_numpy()
+    bank_charge, rtb_sys = _num(trades, "bank_charge"), _num(trades, "rtb_sys")
+
+    out = pd.DataFrame({k: [v] * len(trades) for k, v in maker_data.items()}, index=trades.index)
+    out["Date"] = today
+    out["Repayment Date"] = _dates(trades["repayment_date"])
+    out["Nature"] = trades["opstype"]
+    out["Maker"] = maker_name
+    out["Drawdown ID"] = trades["drawdown_id"]
+    out["Funder Code"] = trades["funder_id"]
+    out["Currency"] = trades["currency"]
+    out["Principal"] = principal
+    out["Interest"] = funder_sysint
+    out["Platform Fee"] = platform_fee
+    out["Spreading"] = spreading_sysint
+    out["Sub"] = np.select([is_repay, is_roll], [bank_charge, rtb_sys], np.nan)
+    out["Total Amount"] = np.select(
+        [is_repay, is_roll],
+        [_num(trades, "repayment_amount") - bank_charge, principal + funder_sysint + spreading_sysint + platform_fee],
+        np.nan)
+    out["Checker"] = result["checker"]
+    out["Note"] = [rate_version_note(v) for v in result["rate_version"]]
+    out["Note2"] = trades["repayment_id"]
+    return out
+
+
+def trade_warnings(trades: pd.DataFrame, result: pd.DataFrame) -> pd.Series:
+    """页面 Warnings 区的同一组检查，逐笔合并成一个字符串（无警告为空串）"""
+    principal, outstanding = _num(trades, "principal"), _num(trades, "outstanding_principal")
+    funder_sysint, rtb_sys = _num(trades, "funder_sysint"), _num(trades, "rtb_sys")
+    left = principal + funder_sysint - result["platform_fee"].to_numpy() + _num(trades, "spreading_sysint") + rtb_sys
+    right = _num(trades, "repayment_amount") - _num(trades, "bank_charge")
+    fundertype, ratetype = result["fundertype"].to_numpy(), result["ratetype"].to_numpy()
+    gap_days = result["rate_gap_days"].to_numpy()
+    unsettled = outstanding - principal
+
+    checks = [
+        ((unsettled < 10) & (unsettled > 0.001),
+         lambda i: "Fully settle failed: outstanding_principal - principal_amount < 10"),
+        (np.abs(left - right) > 0.001,
+         lambda i: f"Cash flow mismatch: left side {left[i]:.2f} ≠ right side {right[i]:.2f}"),
+        ((fundertype == "Main") & (funder_sysint == 0),
+         lambda i: "Funder code violation: funder type is 'Main' but Funder interest is 0"),
+        ((fundertype == "Zero") & (funder_sysint != 0),
+         lambda i: f"Funder code violation: funder type is 'Zero' but Funder interest is {funder_sysint[i]}"),
+        (gap_days > 0,
+         lambda i: f"Rate data missing: {int(gap_days[i])} day(s) have no {ratetype[i]} rate"),
+        ((trades["opstype"] == "Repayment").to_numpy() & (rtb_sys != 0),
+         lambda i: f"rtb_sys should be 0, but is {rtb_sys[i]}"),
+    ]
+    out = [[] for _ in range(len(trades))]
+    for mask, message in checks:
+        for i in np.flatnonzero(mask):
+            out[i].append(message(i))
+    return pd.Series(["; ".join(w) for w in out], index=trades.index, dtype=object)
+
+
+def summarize(detail: pd.DataFrame) -> pd.DataFrame:
+    """按 币种 + 利率类型 汇总笔数、Checker 结果、警告数和金额，最后一行 All 为合计"""
+    d = detail.assign(
+        OK=detail["checker"].str.startswith("ok"),
+        Err=detail["checker"].str.startswith("err"),
+        HasWarning=detail["warnings"] != "",
+    )
+    agg = {"Trades": ("checker", "size"), "OK": ("OK", "sum"), "Errors": ("Err", "sum"),
+           "Warnings": ("HasWarning", "sum"), "Principal": ("principal", "sum"),
+           "Funder Interest": ("funder_interest", "sum"), "Spreading": ("spreading", "sum"),
+           "Platform Fee": ("platform_fee_calc", "sum")}
+    by = d.groupby(["currency", "ratetype"], dropna=False).agg(**agg).reset_index()
+    total = pd.DataFrame([{"currency": "All", "ratetype": "",
+                           **{k: d[c].size if f == "size" else d[c].sum() for k, (c, f) in agg.items()}}])
+    summary = pd.concat([by, total], ignore_index=True).rename(columns={"currency": "Currency", "ratetype": "Rate Type"})
+    summary["Rate Version"] = detail["rate_version"].iloc[0] if len(detail) else None
+    return summary
+
+
+def _calculate(trades: pd.DataFrame, rates, today: str, maker_name: str) -> tuple:
+    # 已补齐的交易 -> (Maker 表, 明细)
+    result = compute_interest(trades, rates)
+    maker = build_maker_table(trades, result, today, maker_name)
+    # 覆盖列以计算结果为准；与输入同名的计算列（platform_fee、funder_intrate）加 _calc 后缀，两个值都保留
+    inputs = trades.drop(columns=[c for c in OVERRIDE_COLUMNS[2:] if c in trades.columns])
+    detail = pd.concat([inputs, result.rename(columns={c: f"{c}_calc" for c in result.columns if c in inputs.columns})],
+                       axis=1)
+    for k in DATE_FIELDS:
+        detail[k] = _dates(detail[k])
+    detail["warnings"] = trade_warnings(trades, result)
+    return maker, detail
+
+
+def run_batch(trades: pd.DataFrame, rates, today: str = None, maker_name: str = "",
+              opstype: str = "Repayment", xdj: bool = False) -> tuple:
+    """
+    批量计算：返回 (Maker 表, 明细 = 交易 + 计算结果 + warnings, 汇总)。
+    rates 为 RateIndex（rate_store.load_rate_index 的结果）。
+    """
+    today = today or date.today().strftime('%Y-%m-%d')
+    maker, detail = _calculate(prepare_trades(trades, opstype, xdj), rates, today, maker_name)
+    return maker, detail, summarize(detail)
+
+
+# ---------- 分片并行 + 断点续跑：按输入顺序切成固定大小的分片，完成的分片落盘，重跑时跳过 ----------
+CHUNK_SIZE = 1000
+_CHUNK_FILE = re.compile(r"chunk\d{5}-[0-9a-f]{16}\.(maker|detail)\.parquet")
+_worker_rates = None   # 每个工作进程一份 RateIndex（fork 时直接继承父进程的，spawn 时由 initializer 映射版本快照文件）
+
+
+def _init_worker(db_path: str, version: int):
+    global _worker_rates
+    if _worker_rates is None or _worker_rates.version != version:
+        _worker_rates = rate_store.shared_rate_index(version, db_path)
+
+
+def _run_shard(task: tuple) -> tuple:
+    """单个分片（进程池任务）：只传交易，不传利率表；结果写入检查点后返回"""
+    key, trades, today, maker_name, checkpoint = task
+    maker, detail = (_parquet_safe(df) for df in _calculate(trades, _worker_rates, today, maker_name))
+    if checkpoint:
+        _save_shard(checkpoint, key, maker, detail)
+    return key, maker, detail
+
+
+def chunk_trades(trades: pd.DataFrame, chunk_size: int = CHUNK_SIZE) -> list:
+    """按输入顺序切成每片 chunk_size 笔的分片（最后一片可能不足）"""
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    return [trades.iloc[i:i + chunk_size] for i in range(0, len(trades), chunk_size)]
+
+
+def _shard_digest(trades: pd.DataFrame, version: int, today: str, maker_name: str) -> str:
+    # 分片内容 + 利率版本 + 输出参数都相同，检查点才可复用
+    h = hashlib.sha1(pd.util.hash_pandas_object(trades.astype(str), index=True).to_numpy().tobytes())
+    h.update(f"{version}|{today}|{maker_name}".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _shard_paths(checkpoint: str, key: str) -> tuple:
+    return tuple(os.path.join(checkpoint, f"{key}.{part}.parquet") for part in ("maker", "detail"))
+
+
+def _parquet_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    object 列里混着不同类型（如表格输入的 Remark / drawdown_id 同时有文本和数字）时 pyarrow 写不了，转成 string；
+    只含一种类型的 object 列（日期、文本）保持不变。新算的分片和从检查点读回的分片因此列类型一致。
+    """
+    mixed = [c for c in df.columns if df[c].dtype == object and df[c].dropna().map(type).nunique() > 1]
+    return df.astype({c: "string" for c in mixed}) if mixed else df
+
+
+def _save_shard(checkpoint: str, key: str, maker: pd.DataFrame, detail: pd.DataFrame):
+    # 检查点用 parquet（只有数据，读取时不会执行任何代码）；先写临时文件再 os.replace，中途崩溃不会留下半个文件
+    # detail 最后写：两个文件都在才算完成
+    for df, path in zip((maker, detail), _shard_paths(checkpoint, key)):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp)
+        os.replace(tmp, path)
+
+
+def _load_shard(checkpoint: str, key: str):
+    paths = _shard_paths(checkpoint, key)
+    if not all(os.path.exists(p) for p in paths):
+        return None
+    try:
+        return tuple(pd.read_parquet(p) for p in paths)
+    except Exception:   # 损坏或不是本程序写的文件：当作没有检查点，重新计算并覆盖
+        return None
+
+
+def clear_checkpoint(checkpoint: str) -> int:
+    """删除目录中的分片检查点（只删本程序命名的文件），目录空了一并删除；返回删除的文件数"""
+    if not checkpoint or not os.path.isdir(checkpoint):
+        return 0
+    removed = 0
+    for name in os.listdir(checkpoint):
+        if _CHUNK_FILE.fullmatch(name):
+            os.remove(os.path.join(checkpoint, name))
+            removed += 1
+    if not os.listdir(checkpoint):
+        os.rmdir(checkpoint)
+    return removed
+
+
+def run_sharded(trades: pd.DataFrame, db_path: str = rate_store.DB_PATH, version: int = None,
+                today: str = None, maker_name: str = "", opstype: str = "Repayment", xdj: bool = False,
+                workers: int = None, checkpoint: str = None, chunk_size: int = CHUNK_SIZE, log=None) -> tuple:
+    """
+    与 run_batch 结果相同（行顺序同输入），但按输入顺序切成 chunk_size 笔一片，放进进程池：
+    - 利率表用版本快照（rate_store.shared_rate_index），每个工作进程只映射一次（fork 继承 / initializer），
+      任务里只有该分片的交易
+    - checkpoint 目录存放已完成分片（按序号和分片内容、利率版本、日期、Maker 的摘要命名），
+      重跑时直接读取，只算剩下的；改动个别交易只会让所在分片重算
+    """
+    global _worker_rates
+    today = today or date.today().strftime('%Y-%m-%d')
+    if version is None:
+        conn = rate_store.connect(db_path)
+        try:
+            version = rate_store.latest_version(conn)
+        finally:
+            conn.close()
+    if version is None:
+        raise ValueError(f"No published rates in {db_path}")
+    # 与页面和工作进程相同：映射该版本的只读快照，不从库重建
+    rates = rate_store.shared_rate_index(version, db_path)
+    trades = prepare_trades(trades, opstype, xdj)
+    if checkpoint:
+        os.makedirs(checkpoint, exist_ok=True)
+
+    done, tasks = {}, []
+    for i, shard in enumerate(chunk_trades(trades, chunk_size)):
+        key = f"chunk{i:05d}-{_shard_digest(shard, rates.version, today, maker_name)}"
+        saved = _load_shard(checkpoint, key) if checkpoint else None
+        if saved is not None:
+            done[key] = saved
+        else:
+            tasks.append((key, shard, today, maker_name, checkpoint))
+    if log:
+        log(f"{len(done) + len(tasks)} shard(s): {len(done)} from checkpoint, {len(tasks)} to run")
+
+    _worker_rates = rates   # fork 出的工作进程直接继承，无需重新载入
+    workers = min(workers or os.cpu_count() or 1, len(tasks)) if tasks else 1
+    if workers <= 1:
+        for key, maker, detail in map(_run_shard, tasks):
+            done[key] = (maker, detail)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(os.path.abspath(db_path), rates.version)) as pool:
+            futures = [pool.submit(_run_shard, t) for t in tasks]
+            for future in as_completed(futures):
+                key, maker, detail = future.result()
+                done[key] = (maker, detail)
+                if log:
+                    log(f"shard {key} done ({len(detail)} trades)")
+
+    if not done:   # 没有交易
+        maker, detail = _calculate(trades, rates, today, maker_name)
+    else:
+        keys = sorted(done)   # 分片序号即输入顺序
+        maker = pd.concat([done[k][0] for k in keys])
+        detail = pd.concat([done[k][1] for k in keys])
+    return maker, detail, summarize(detail)
+
+
+def write_outputs(output: str, maker: pd.DataFrame, detail: pd.DataFrame, summary: pd.DataFrame) -> list:
+    """.xlsx 写成 Maker / Detail / Summary 三个 sheet；其他后缀按 TSV 写三个文件（<名称>_maker.tsv 等）"""
+    tables = {"Maker": maker, "Detail": detail, "Summary": summary}
+    if output.lower().endswith(".xlsx"):
+        with pd.ExcelWriter(output) as writer:
+            for name, df in tables.items():
+                df.to_excel(writer, sheet_name=name, index=False)
+        return [output]
+    stem = os.path.splitext(output)[0]
+    paths = []
+    for name, df in tables.items():
+        path = f"{stem}_{name.lower()}.tsv"
+        df.to_csv(path, sep="\t", index=False)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Data Processor calculation over a batch of trades.")
+    parser.add_argument("input", help="LMS text file, or a parsed trade table (.csv/.tsv/.xlsx)")
+    parser.add_argument("-o", "--output", default="maker_batch.xlsx", help=".xlsx, or a .tsv stem")
+    parser.add_argument("--opstype", choices=OPSTYPES, default="Repayment", help="used where the input has no opstype")
+    parser.add_argument("--xdj", action="store_true", help="小店金 for trades without an xdj column")
+    parser.add_argument("--maker", default="", help="Maker name")
+    parser.add_argument("--date", default=None, help="Date column of the maker table (default today)")
+    parser.add_argument("--rate-version", type=int, default=None, help="rate store version (default latest)")
+    parser.add_argument("--db", default=rate_store.DB_PATH, help="rate store path")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="shard across N processes")
+    parser.add_argument("--checkpoint", default=None,
+                        help="directory for finished shards; rerun to resume (removed once the output is written)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="trades per shard")
+    args = parser.parse_args(argv)
+
+    trades = read_trades(args.input)
+    if args.workers is not None or args.checkpoint:
+        maker, detail, summary = run_sharded(trades, args.db, args.rate_version, args.date, args.maker,
+                                             args.opstype, args.xdj, args.workers, args.checkpoint,
+                                             args.chunk_size, log=print)
+    else:
+        rates = rate_store.load_rate_index(args.db, args.rate_version)
+        if rates.version is None:
+            parser.error(f"no published rates in {args.db}")
+        maker, detail, summary = run_batch(trades, rates, args.date, args.maker, args.opstype, args.xdj)
+    paths = write_outputs(args.output, maker, detail, summary)
+    clear_checkpoint(args.checkpoint)   # 结果已写出，检查点不再需要
+    print(summary.to_string(index=False))
+    print("Wrote " + ", ".join(paths))
+
+
+if __name__ == "__main__":
+    main()
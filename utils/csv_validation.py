@@ -0,0 +1,547 @@
+import io
+import csv
+from operator import itemgetter
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+
+# =========================
+# 固定账户配置
+# =========================
+ACCOUNT_2691 = "001302691"
+ACCOUNT_2685 = "001302685"
+FUNDER_ACCOUNT_MAP: Dict[str, str] = {
+    "FP0000": "001302728",
+    "FP0056": "001302922",
+    "FP0053": "001302895",
+    "FP0057": "001302931",
+}
+
+LINE_COLUMNS = [
+    "Type", "Posting", "CODE", "MMDD",
+    "Trade Code Raw", "TradeCodeLast5", "Funder Code", "Currency", "Amount"
+]
+TRANSFER_COLUMNS = [
+    "Trade Code Raw", "Posting", "Currency", "Amount",
+    "DebitAccount", "CreditAccount", "Valid", "Issue"
+]
+
+
+# =========================
+# Approval 粘贴数据（无表头，从 Trade Code 到 Total Amount）
+# =========================
+EXPECTED_COLS: List[str] = [
+    "Trade Code", "Nature", "Funder Code", "Currency",
+    "Principal", "Interest", "Platform Fee", "Spreading", "Total Amount"
+]
+ID_COLS = {"Trade Code", "Funder Code", "Currency", "Nature"}
+NUM_COLS = {"Principal", "Interest", "Platform Fee", "Spreading", "Total Amount"}
+
+
+# ---------- 解析无表头的粘贴文本 ----------
+def parse_rows_no_header(s: str, expected_cols: List[str] = EXPECTED_COLS) -> pd.DataFrame:
+    s = s.strip("\n")
+    if not s:
+        return pd.DataFrame(columns=expected_cols)
+    lines = [ln for ln in s.splitlines() if ln.strip()]
+    sep = "\t" if any("\t" in ln for ln in lines) else ","
+    rows = [ln.split(sep) for ln in lines]
+    rows = [[cell.strip() for cell in r] for r in rows]
+    target_len = len(expected_cols)
+    normalized = []
+    for r in rows:
+        if len(r) < target_len:
+            normalized.append(r + [""] * (target_len - len(r)))
+        else:
+            normalized.append(r[:target_len])
+    df = pd.DataFrame(normalized, columns=expected_cols)
+    return df
+
+
+# ---------- 清洗类型 ----------
+def clean_types(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    for c in df.columns:
+        df[c] = df[c].astype(str).str.strip()
+    for c in df.columns:
+        if c in ID_COLS:
+            df[c] = df[c].astype("string")
+    for c in df.columns:
+        if c in NUM_COLS:
+            s = df[c].astype("string").str.replace(",", "", regex=False).str.strip()
+            s = s.replace({"": pd.NA})
+            df[c] = s.astype(float)
+    return df
+
+
+# ---------- 构建明细（Posting/金额；CODE 固定取 Trade Code 后 5 位；类型仅 RPTXX/INTSP） ----------
+def build_lines(df: pd.DataFrame, tol: float = 1e-6,
+                rpt_prefix: str = "RPTXX",
+                intsp_prefix: str = "INTSP",
+                mmdd: str = "0000") -> pd.DataFrame:
+    """
+    每笔交易拆成 RPTXX（本金+利息+平台费）与 INTSP（Spreading）两类明细，金额 ~0 的不出行。
+    整列运算：先 melt 成 (交易, 类型) 长表，再按交易顺序排列（同一笔 RPTXX 在前）。
+    """
+    n = len(df)
+    code = df["Trade Code"].astype("string").str.extract(r"(\d{5})$")[0].reset_index(drop=True)
+    info = pd.DataFrame({
+        "CODE": code,
+        "Trade Code Raw": df["Trade Code"].astype("string").reset_index(drop=True),
+        "Funder Code": df["Funder Code"].astype("string").str.strip().reset_index(drop=True),
+        "Currency": df["Currency"].astype("string").str.strip().reset_index(drop=True),
+    })
+    p, i, f, s = (df[c].fillna(0.0).to_numpy(dtype=float) for c in ["Principal", "Interest", "Platform Fee", "Spreading"])
+    wide = pd.DataFrame({
+        "_row": np.arange(n),
+        "RPTXX": np.round(p + i + f, 2),
+        "INTSP": np.round(s, 2),
+    })
+
+    lines = wide.melt(id_vars="_row", var_name="Type", value_name="Amount")
+    lines = lines.sort_values("_row", kind="stable")                       # 同一笔：RPTXX → INTSP
+    lines = lines.loc[lines["Amount"].notna() & (lines["Amount"].abs() > tol)]
+
+    rows = info.iloc[lines["_row"].to_numpy()].reset_index(drop=True)
+    prefix = lines["Type"].map({"RPTXX": rpt_prefix, "INTSP": intsp_prefix}).reset_index(drop=True)
+    rows["Type"] = lines["Type"].to_numpy()
+    rows["Posting"] = (prefix.astype("string") + rows["CODE"] + "01" + mmdd).fillna("")  # 无 CODE 时为空
+    rows["MMDD"] = mmdd
+    rows["TradeCodeLast5"] = rows["CODE"]
+    rows["Amount"] = lines["Amount"].to_numpy(dtype=float)
+    return rows[LINE_COLUMNS]
+
+
+# ---------- 生成转账腿（保留 Valid；RPTXX/INTSP 路由规则） ----------
+def generate_transfers_full(
+    lines_df: pd.DataFrame,
+    account_2691: str = ACCOUNT_2691,
+    account_2685: str = ACCOUNT_2685,
+    funder_account_map: Dict[str, str] = FUNDER_ACCOUNT_MAP,
+    tol: float = 1e-6
+) -> pd.DataFrame:
+    """
+    逐条校验 + 账户路由，全部用布尔掩码完成：
+    - RPTXX：2691 → 资金方账户（FUNDER_ACCOUNT_MAP），金额取绝对值
+    - INTSP：正数 2691 → 2685；负数 2685 → 2691（取绝对值）
+    Issue 按检查顺序用 "; " 连接；前面的检查不通过时不再做路由检查。
+    """
+    def text(col):
+        s = lines_df[col] if col in lines_df else pd.Series(pd.NA, index=lines_df.index)
+        return s.astype("string").str.strip()
+
+    posting = text("Posting").fillna("")
+    rtype = text("Type").fillna("")
+    code = text("CODE")
+    funder = text("Funder Code").fillna("")
+    ccy = text("Currency").fillna("")
+    raw_amount = lines_df["Amount"] if "Amount" in lines_df else pd.Series(np.nan, index=lines_df.index)
+    amount = pd.to_numeric(raw_amount, errors="coerce").to_numpy(dtype=float)
+
+    issue = pd.Series("", index=lines_df.index, dtype="string")
+
+    def flag(mask, message):
+        nonlocal issue
+        issue = issue.where(~mask, issue + message + "; ")
+
+    # 基础校验
+    code_missing = (code.isna() | (code == "")).to_numpy()
+    amount_na = raw_amount.isna().to_numpy()
+    not_numeric = np.isnan(amount) & ~amount_na
+    no_ccy = (ccy == "").to_numpy()
+    flag(code_missing, "CODE missing (Trade Code must end with 5 digits)")
+    flag(amount_na, "Amount is NA")
+    flag(not_numeric, "Amount not numeric")
+    flag(no_ccy, "Missing Currency")
+    valid = ~(code_missing | amount_na | not_numeric | no_ccy)
+    tiny = valid & (np.abs(amount) <= tol)
+    flag(tiny, "Amount ~ 0")
+    valid &= ~tiny
+
+    # 路由
+    is_rpt = (rtype == "RPTXX").to_numpy()
+    is_sp = (rtype == "INTSP").to_numpy()
+    target = funder.map(funder_account_map).to_numpy(dtype=object)
+    unmapped = valid & is_rpt & pd.isna(target)
+    unknown = valid & ~is_rpt & ~is_sp
+    flag(unmapped, "Funder " + funder + " not mapped")
+    flag(unknown, "Unknown Type")
+    valid &= ~(unmapped | unknown)
+
+    rpt_ok = valid & is_rpt
+    sp_neg = valid & is_sp & (amount < 0)
+    sp_pos = valid & is_sp & ~(amount < 0)
+    debit = np.select([rpt_ok, sp_neg, sp_pos], [account_2691, account_2685, account_2691], None)
+    credit = np.select([rpt_ok, sp_neg, sp_pos], [target, account_2691, account_2685], None)
+    amt_out = np.where(valid, np.where(is_rpt | sp_neg, np.abs(amount), amount), np.nan)
+
+    out = pd.DataFrame({
+        "Trade Code Raw": lines_df["Trade Code Raw"] if "Trade Code Raw" in lines_df else None,
+        "Posting": posting,
+        "Currency": ccy,
+        "Amount": amt_out,
+        "DebitAccount": debit,
+        "CreditAccount": credit,
+        "Valid": valid,
+        "Issue": issue.str.removesuffix("; "),
+    }, index=lines_df.index)
+    return out[TRANSFER_COLUMNS].reset_index(drop=True)
+
+
+# ---------- 解析 DBS CSV（按列字母抽取，流式读取） ----------
+# 列字母 -> 输出列名：C 借方、D 币种、E Posting（前10位为 key）、P 贷方、AB 金额、AJ Trade Code
+CSV_LETTER_COLUMNS = {
+    "C": "CSV_Debit",
+    "D": "CSV_Currency",
+    "E": "CSV_E_Full",
+    "P": "CSV_Credit",
+    "AB": "CSV_AB_Raw",
+    "AJ": "CSV_TradeCodeRaw",
+}
+CSV_VIEW_COLUMNS = [
+    "CSV_RowIndex", "CSV_Key_E10", "CSV_Debit", "CSV_Credit", "CSV_Currency",
+    "CSV_Amount", "CSV_TradeCodeRaw", "CSV_E_Full", "CSV_AB_Raw",
+]
+CSV_CHUNK_ROWS = 50_000
+
+
+def col_letter_to_index(col_letter: str) -> int:
+    """列字母转索引，如 'A'->0, 'C'->2, 'AB'->27, 'AJ'->35（0-based）"""
+    col_letter = col_letter.strip().upper()
+    idx = 0
+    for ch in col_letter:
+        if not ('A' <= ch <= 'Z'):
+            raise ValueError(f"非法列字母: {col_letter}")
+        idx = idx * 26 + (ord(ch) - ord('A') + 1)
+    return idx - 1  # 0-based
+
+
+def parse_amount_relaxed(raw: pd.Series) -> pd.Series:
+    """
+    更宽松的金额解析（整列）：
+    - 移除非数字/符号的前缀（如 'USD ', '$'）
+    - 允许千位逗号、负号 '-'、前后空白
+    - 允许括号负数 '(1,234.56)' → -1234.56
+    - 为空或无法转 float 时为 NaN
+    """
+    s = raw.astype("string").str.strip()
+    paren = (s.str.startswith("(") & s.str.endswith(")")).fillna(False)
+    s = s.where(~paren, s.str[1:-1])
+    s = s.str.replace(r"[^\d,\.\-]", "", regex=True).str.replace(",", "", regex=False)
+    ok = s.str.fullmatch(r"-?(\d+\.?\d*|\.\d+)").fillna(False)   # float() 能解析的形式
+    val = pd.Series(np.nan, index=raw.index)
+    val[ok] = s[ok].astype(float)
+    return val.where(~paren, -val)
+
+
+def _iter_csv_rows(uploaded_csv):
+    # 逐行读取（Streamlit UploadedFile / 二进制文件对象 / 路径），不把整份文件解码成一个字符串
+    if hasattr(uploaded_csv, "read"):
+        if hasattr(uploaded_csv, "seek"):
+            uploaded_csv.seek(0)   # UploadedFile 可能已被读过
+        text = io.TextIOWrapper(uploaded_csv, encoding="utf-8", errors="replace", newline="")
+        try:
+            yield from csv.reader(text, delimiter=",", quotechar='"')
+        finally:
+            text.detach()          # 不随包装器关闭上传文件
+    else:
+        with open(uploaded_csv, encoding="utf-8", errors="replace", newline="") as f:
+            yield from csv.reader(f, delimiter=",", quotechar='"')
+
+
+def _csv_chunk_view(row_index: list, cells: list) -> pd.DataFrame:
+    # 一块行 -> 列视图：整列去空白、截 key、解析金额
+    view = pd.DataFrame(cells, columns=list(CSV_LETTER_COLUMNS.values()), dtype="string")
+    for c in view.columns:
+        view[c] = view[c].str.strip()
+    view["CSV_RowIndex"] = np.asarray(row_index, dtype=np.int64)
+    view["CSV_Key_E10"] = view["CSV_E_Full"].str[:10]   # 与 Posting 前10位比对
+    view["CSV_Amount"] = parse_amount_relaxed(view["CSV_AB_Raw"])
+    return view[CSV_VIEW_COLUMNS]
+
+
+def parse_csv_by_letters(uploaded_csv, chunksize: int = CSV_CHUNK_ROWS) -> pd.DataFrame:
+    """
+    使用列字母抽取 CSV：
+    C → DebitAccount, D → Currency, E → Key(前10位), P → CreditAccount,
+    AB → Amount（更稳健的解析）, AJ → TradeCodeRaw
+    - 流式读取，每 chunksize 行只保留上述 6 列，再整块做清洗与金额解析
+    - 金额允许：千位逗号、负号、括号负数、前后空白、夹杂货币符号；仅当确实无法解析成数值时为空
+    - 列数不足的行按空字符串处理；空行跳过但计入 CSV_RowIndex
+    """
+    idxs = [col_letter_to_index(k) for k in CSV_LETTER_COLUMNS]
+    width = max(idxs) + 1
+    pick = itemgetter(*idxs)
+
+    views, row_index, cells = [], [], []
+    for r_idx, cols in enumerate(_iter_csv_rows(uploaded_csv)):
+        if not cols:
+            continue
+        row_index.append(r_idx)
+        cells.append(pick(cols) if len(cols) >= width else tuple(cols[i] if i < len(cols) else "" for i in idxs))
+        if len(cells) >= chunksize:
+            views.append(_csv_chunk_view(row_index, cells))
+            row_index, cells = [], []
+    if cells or not views:
+        views.append(_csv_chunk_view(row_index, cells))
+    return pd.concat(views, ignore_index=True) if len(views) > 1 else views[0]
+
+
+# ---------- 对账：按 Posting 前10位 ↔ CSV E 前10位 比对 ----------
+# 转账侧 MatchStatus 按优先级排列（前面的条件先判定）
+TRANSFER_STATUSES = [
+    "MISSING_IN_CSV",
+    "OK",
+    "ACCOUNT_DEBIT_MISMATCH",
+    "ACCOUNT_CREDIT_MISMATCH",
+    "CURRENCY_MISMATCH",
+    "AMOUNT_MISMATCH",
+]
+# 只在 CSV 侧出现的行：同 key 多出来的 CSV 行 / key 对不上任何转账的 CSV 行
+CSV_ONLY_STATUSES = [
+    "DUPLICATE_IN_CSV",
+    "UNMATCHED_CSV",
+]
+# Posting key 对不上、但按 币种+金额 在 CSV 中找到的转账（疑似参考号录错，需人工确认）
+FALLBACK_STATUS = "KEY_MISMATCH"
+MATCH_STATUSES = TRANSFER_STATUSES + [FALLBACK_STATUS] + CSV_ONLY_STATUSES
+
+RECON_COLUMNS = [
+    "MatchStatus",
+    "PostingKey", "CSV_Key_E10",
+    "Posting", "CSV_E_Full",
+    "Currency", "CSV_Currency",
+    "Amount", "CSV_Amount",
+    "DebitAccount", "CSV_Debit",
+    "CreditAccount", "CSV_Credit",
+    "Trade Code Raw", "CSV_TradeCodeRaw",
+    "CSV_RowIndex",
+]
+
+
+def _same(a: pd.Series, b: pd.Series) -> np.ndarray:
+    # 文本相等；两边都为空也算相等
+    a, b = a.astype("string"), b.astype("string")
+    return ((a == b).fillna(False) | (a.isna() & b.isna())).to_numpy(dtype=bool)
+
+
+def match_status(merged: pd.DataFrame, amount_tol: float = 0.01) -> np.ndarray:
+    """
+    整列判定转账行的 MatchStatus（np.select，按 TRANSFER_STATUSES 的优先级）：
+    CSV 侧借方/贷方/金额全空 → MISSING_IN_CSV；全部一致 → OK；否则报第一个不一致的项。
+    """
+    missing = (merged["CSV_Debit"].isna() & merged["CSV_Credit"].isna() & merged["CSV_Amount"].isna()).to_numpy()
+    debit_ok = _same(merged["DebitAccount"], merged["CSV_Debit"])
+    credit_ok = _same(merged["CreditAccount"], merged["CSV_Credit"])
+    ccy_ok = _same(merged["Currency"], merged["CSV_Currency"])
+    amt_tf = pd.to_numeric(merged["Amount"], errors="coerce").to_numpy(dtype=float)
+    amt_csv = pd.to_numeric(merged["CSV_Amount"], errors="coerce").to_numpy(dtype=float)
+    with np.errstate(invalid="ignore"):
+        amt_ok = np.abs(amt_tf - amt_csv) <= amount_tol   # 任一侧为空时为 False
+
+    return np.select(
+        [missing, debit_ok & credit_ok & ccy_ok & amt_ok, ~debit_ok, ~credit_ok, ~ccy_ok, ~amt_ok],
+        TRANSFER_STATUSES,
+        "UNKNOWN",
+    ).astype(object)
+
+
+def match_status_counts(result: pd.DataFrame) -> pd.DataFrame:
+    """各 MatchStatus 的笔数（按优先级排列，没有出现的状态计 0）"""
+    counts = result["MatchStatus"].value_counts()
+    order = MATCH_STATUSES + [s for s in counts.index if s not in MATCH_STATUSES]
+    counts = counts.reindex(order, fill_value=0)
+    return pd.DataFrame({"MatchStatus": counts.index, "Count": counts.to_numpy(dtype=int)})
+
+
+def _has_key(key: pd.Series) -> np.ndarray:
+    return (key.notna() & (key != "")).to_numpy(dtype=bool)
+
+
+def _group_key(df: pd.DataFrame, cols: list) -> pd.Series:
+    # 多列拼成一个可排序的分组键（空值自成一组，与 _same 的“两边都为空也算相等”一致）
+    key = df[cols[0]].astype("string").fillna("\0")
+    for col in cols[1:]:
+        key = key + "\x1f" + df[col].astype("string").fillna("\0")
+    return key.astype(object)
+
+
+def _sweep_pairs(left: pd.DataFrame, right: pd.DataFrame, amount_tol: float):
+    """
+    双指针扫描：两侧都按 (grp, amt, pos) 排序，同组且金额差 <= amount_tol 即配对、两侧同时前移，
+    否则前移（组、金额）较小的一侧。一对一，排序 O(n log n) + 扫描 O(n)。金额为空的行不参与。
+    """
+    l = left.dropna(subset=["amt"]).sort_values(["grp", "amt", "pos"], kind="stable")
+    r = right.dropna(subset=["amt"]).sort_values(["grp", "amt", "pos"], kind="stable")
+    lg, la, lp = l["grp"].tolist(), l["amt"].tolist(), l["pos"].tolist()
+    rg, ra, rp = r["grp"].tolist(), r["amt"].tolist(), r["pos"].tolist()
+    out_l, out_r = [], []
+    i = j = 0
+    while i < len(lp) and j < len(rp):
+        if lg[i] != rg[j]:
+            if lg[i] < rg[j]:
+                i += 1
+            else:
+                j += 1
+        elif la[i] - ra[j] > amount_tol:
+            j += 1
+        elif ra[j] - la[i] > amount_tol:
+            i += 1
+        else:
+            out_l.append(lp[i])
+            out_r.append(rp[j])
+            i += 1
+            j += 1
+    return np.asarray(out_l, dtype=np.int64), np.asarray(out_r, dtype=np.int64)
+
+
+def _rank_pairs(left: pd.DataFrame, right: pd.DataFrame, amount_tol: float):
+    """同组内两侧按 (amt, pos) 排名，第 k 名配第 k 名（金额不限）；一对一，O(n log n)"""
+    def ranked(df):
+        df = df.sort_values(["grp", "amt", "pos"], kind="stable")
+        return df.assign(rank=df.groupby("grp", sort=False).cumcount())[["grp", "rank", "pos"]]
+    pairs = ranked(left).merge(ranked(right), on=["grp", "rank"], suffixes=("_l", "_r"))
+    return pairs["pos_l"].to_numpy(dtype=np.int64), pairs["pos_r"].to_numpy(dtype=np.int64)
+
+
+def _pair_in_stages(left: pd.DataFrame, right: pd.DataFrame, stages: list, amount_tol: float):
+    """
+    分阶段一对一配对：left / right 含 pos、amt 及各分组列；stages = [(分组列, "sweep" 或 "rank"), ...]，
+    按优先级排列，前面阶段配上的行不再参与后面的阶段。返回 (左侧 pos, 右侧 pos)。
+    """
+    out_l, out_r = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    for cols, how in stages:
+        if left.empty or right.empty:
+            break
+        pair = _sweep_pairs if how == "sweep" else _rank_pairs
+        lp, rp = pair(left.assign(grp=_group_key(left, cols)), right.assign(grp=_group_key(right, cols)), amount_tol)
+        out_l.append(lp)
+        out_r.append(rp)
+        left = left.loc[~left["pos"].isin(lp)]
+        right = right.loc[~right["pos"].isin(rp)]
+    return np.concatenate(out_l), np.concatenate(out_r)
+
+
+# key 相同时的配对优先级：币种一致且金额在容差内 > 币种一致 > 金额在容差内 > 其余按金额排名
+_POSTING_STAGES = [
+    (["key", "ccy"], "sweep"),
+    (["key", "ccy"], "rank"),
+    (["key"], "sweep"),
+    (["key"], "rank"),
+]
+
+# 按金额补配时的优先级：借贷账户都一致 > 借方一致 > 贷方一致 > 只看币种
+_AMOUNT_STAGES = [
+    (["ccy", "debit", "credit"], "sweep"),
+    (["ccy", "debit"], "sweep"),
+    (["ccy", "credit"], "sweep"),
+    (["ccy"], "sweep"),
+]
+
+
+def match_postings(tf: pd.DataFrame, csv_view: pd.DataFrame, amount_tol: float = 0.01) -> np.ndarray:
+    """
+    一对一匹配：每笔转账最多对应一行 CSV，每行 CSV 最多被用一次。
+    - 只在 PostingKey ↔ CSV_Key_E10 相同的行之间配对，不展开 key 重复时的全部组合
+    - 同 key 内按 _POSTING_STAGES 的优先级分阶段配对（排序 + 双指针 / 排名），整体 O(n log n)
+    返回每笔转账对应的 CSV 行位置，未匹配为 -1。
+    """
+    left = pd.DataFrame({
+        "pos": np.arange(len(tf)),
+        "key": tf["PostingKey"].astype("string"),
+        "ccy": tf["Currency"].astype("string"),
+        "amt": pd.to_numeric(tf["Amount"], errors="coerce"),
+    }).loc[_has_key(tf["PostingKey"])]
+    right = pd.DataFrame({
+        "pos": np.arange(len(csv_view)),
+        "key": csv_view["CSV_Key_E10"].astype("string"),
+        "ccy": csv_view["CSV_Currency"].astype("string"),
+        "amt": pd.to_numeric(csv_view["CSV_Amount"], errors="coerce"),
+    }).loc[_has_key(csv_view["CSV_Key_E10"])]
+
+    match = np.full(len(tf), -1, dtype=np.int64)
+    tf_pos, csv_pos = _pair_in_stages(left, right, _POSTING_STAGES, amount_tol)
+    match[tf_pos] = csv_pos
+    return match
+
+
+def match_by_amount(tf: pd.DataFrame, csv_view: pd.DataFrame, tf_rows, csv_rows,
+                    amount_tol: float = 0.01) -> np.ndarray:
+    """
+    第二轮：key 没对上的转账（tf_rows）↔ 剩余 CSV 行（csv_rows），按 币种 + 金额 配对。
+    两侧按 (币种, 金额) 排序后双指针扫描，金额差 <= amount_tol 才配对；
+    按 _AMOUNT_STAGES 先在借贷账户一致的行之间扫描，再逐步放宽。一对一，O(n log n)。
+    返回每笔转账对应的 CSV 行位置，未匹配为 -1。
+    """
+    tf_rows, csv_rows = np.asarray(tf_rows, dtype=np.int64), np.asarray(csv_rows, dtype=np.int64)
+    left = pd.DataFrame({
+        "pos": tf_rows,
+        "ccy": tf["Currency"].astype("string").iloc[tf_rows].to_numpy(),
+        "debit": tf["DebitAccount"].astype("string").iloc[tf_rows].to_numpy(),
+        "credit": tf["CreditAccount"].astype("string").iloc[tf_rows].to_numpy(),
+        "amt": pd.to_numeric(tf["Amount"], errors="coerce").to_numpy(dtype=float)[tf_rows],
+    })
+    right = pd.DataFrame({
+        "pos": csv_rows,
+        "ccy": csv_view["CSV_Currency"].astype("string").iloc[csv_rows].to_numpy(),
+        "debit": csv_view["CSV_Debit"].astype("string").iloc[csv_rows].to_numpy(),
+        "credit": csv_view["CSV_Credit"].astype("string").iloc[csv_rows].to_numpy(),
+        "amt": pd.to_numeric(csv_view["CSV_Amount"], errors="coerce").to_numpy(dtype=float)[csv_rows],
+    })
+    # 币种为空的行不参与（与之前一致）
+    left, right = left.loc[left["ccy"].notna()], right.loc[right["ccy"].notna()]
+
+    match = np.full(len(tf), -1, dtype=np.int64)
+    tf_pos, csv_pos = _pair_in_stages(left, right, _AMOUNT_STAGES, amount_tol)
+    match[tf_pos] = csv_pos
+    return match
+
+
+def reconcile_by_letter_columns(transfers_full_view: pd.DataFrame,
+                                csv_view: pd.DataFrame,
+                                amount_tol: float = 0.01,
+                                amount_fallback: bool = True) -> pd.DataFrame:
+    """
+    转账 ↔ DBS CSV 对账（Posting 前10位 ↔ CSV E 前10位），一对一匹配，不会因 key 重复而扇出。
+    amount_fallback=True 时，key 没对上的转账再按 币种 + 金额 与未匹配的 CSV 行配对，记为 KEY_MISMATCH。
+    结果：每笔转账一行（原顺序），其后为 CSV 侧多出的行：
+    - DUPLICATE_IN_CSV：key 与某笔转账相同但已有其他 CSV 行匹配（如重复发送）
+    - UNMATCHED_CSV：key 对不上任何转账、且金额可解析的 CSV 行（表头等无金额行不列出）
+    """
+    tf = transfers_full_view.reset_index(drop=True).copy()
+    tf["PostingKey"] = tf["Posting"].astype("string").str[:10]
+    for col in ["Trade Code Raw", "Posting", "Currency", "DebitAccount", "CreditAccount"]:
+        tf[col] = tf[col].astype("string")
+    csv_view = csv_view.reset_index(drop=True)
+
+    match = match_postings(tf, csv_view, amount_tol)
+
+    # CSV 侧未被使用的行：key 属于某笔转账的为重复行，其余有金额的为未匹配行
+    left_over = csv_view.drop(index=match[match >= 0])
+    left_over = left_over.loc[_has_key(left_over["CSV_Key_E10"])]
+    dup = left_over["CSV_Key_E10"].isin(tf["PostingKey"]).to_numpy()
+    unmatched = ~dup & left_over["CSV_Amount"].notna().to_numpy()
+
+    # 第二轮：key 没对上的转账 ↔ 未匹配的 CSV 行，按 币种 + 金额 配对
+    fallback = np.zeros(len(tf), dtype=bool)
+    if amount_fallback:
+        tf_rows = np.flatnonzero(match < 0)
+        second = match_by_amount(tf, csv_view, tf_rows, left_over.index[unmatched].to_numpy(), amount_tol)
+        fallback = second >= 0
+        match = np.where(fallback, second, match)
+        unmatched &= ~left_over.index.isin(second[fallback])
+
+    merged = pd.concat([tf, csv_view.reindex(match).reset_index(drop=True)], axis=1)
+    merged["MatchStatus"] = np.where(fallback, FALLBACK_STATUS, match_status(merged, amount_tol))
+
+    extra = left_over.loc[dup | unmatched].copy()
+    extra["MatchStatus"] = np.where(dup[dup | unmatched], "DUPLICATE_IN_CSV", "UNMATCHED_CSV")
+    extra["PostingKey"] = pd.NA
+    extra = extra.sort_values(["MatchStatus", "CSV_RowIndex"], kind="stable")
+
+    result = pd.concat([merged, extra], ignore_index=True)
+    result["CSV_RowIndex"] = result["CSV_RowIndex"].astype("Int64")
+    for c in RECON_COLUMNS:
+        if c not in result.columns:
+            result[c] = pd.NA
+    return result[RECON_COLUMNS]
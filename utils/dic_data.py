@@ -1,5 +1,8 @@
 from datetime import date, datetime, timedelta
+import weakref
+import numpy as np
 import pandas as pd
+from utils.rate_index import to_ordinals
 
 defaults = {
     "drawdown_id": "",
@@ -80,57 +83,104 @@ hibor_refixing_date = {
     date(2026, 7, 15): 1.50,
     date(2026, 8, 17): 1.524850,
 }
-hibor_refixing = []
-
-effective_dates = sorted(hibor_refixing_date.keys())
-
-for i, effective_date in enumerate(effective_dates):
-
-    start_date = effective_date.fromordinal(
-        effective_date.toordinal() + 1
-    )
-
-    if i < len(effective_dates) - 1:
-        end_date = effective_dates[i + 1]
-    else:
-        end_date = date(2030, 12, 31)
-
-    rate = hibor_refixing_date[effective_date]
-
-    d = start_date
-
-    while d <= end_date:
-        hibor_refixing.append(
-            {
-                "Calculation Date": d,
-                "HIBOR Refixing": rate,
-            }
-        )
-
-        d = date.fromordinal(
-            d.toordinal() + 1
-        )
-hibor_refixing_df = pd.DataFrame(hibor_refixing)
-
-
-
-def hibor_cal(sme_drawdown, repayment_date, sofr_df, sme_mit_days, hibor_refixing_df):
-    # Merge the two DataFrames on "Calculation Date"
-    hibor_df = pd.merge(sofr_df, hibor_refixing_df, on="Calculation Date", how="left")
-    hibor_df = hibor_df.loc[(hibor_df["Calculation Date"] >= sme_drawdown) &(hibor_df["Calculation Date"] <= repayment_date)]
-    refixing_dates_hit = [ d for d in hibor_refixing_date.keys() if sme_drawdown <= d <= repayment_date]
-    first_refixing_date = (min(refixing_dates_hit) if refixing_dates_hit else None)
-    sme_drawdown_hibor = sofr_df.loc[sofr_df["Calculation Date"] == sme_drawdown,"Daily Calculated Blended HIBOR"].iloc[0]
-    if (repayment_date - sme_drawdown).days + 1 <= sme_mit_days.days:
-        hibor_df["Applied HIBOR"] = sme_drawdown_hibor
-    elif first_refixing_date is not None:
-        hibor_df["Applied HIBOR"] =  hibor_df.apply(
-            lambda row: sme_drawdown_hibor
-            if row["Calculation Date"] <= first_refixing_date
-            else row["HIBOR Refixing"],
-            axis=1
-        )
-    else:
-        hibor_df["Applied HIBOR"] = sme_drawdown_hibor
-    hibor_df = hibor_df[["Calculation Date","Applied HIBOR"]]
-    return hibor_df
+
+# 重定价表按区间保存（不再逐日展开）：第 k 段覆盖 (REFIX_ORDINALS[k], REFIX_ENDS[k]]，利率 REFIX_RATES[k]
+HIBOR_COLUMN = "Daily Calculated Blended HIBOR"
+HIBOR_REFIXING_END = date(2030, 12, 31)
+_refix_dates = sorted(hibor_refixing_date)
+REFIX_ORDINALS = np.array([d.toordinal() for d in _refix_dates], dtype=np.int64)
+REFIX_RATES = np.array([hibor_refixing_date[d] for d in _refix_dates], dtype=float)
+REFIX_ENDS = np.append(REFIX_ORDINALS[1:], HIBOR_REFIXING_END.toordinal())
+
+
+def hibor_refixing_frame(start=None, end=None) -> pd.DataFrame:
+    """
+    按需展开重定价表为逐日 DataFrame（Calculation Date / HIBOR Refixing），只覆盖 [start, end]。
+    仅供查看或导出；计算请直接用 refixing_rate。
+    """
+    lo = REFIX_ORDINALS[0] + 1 if start is None else max(to_ordinals(start), REFIX_ORDINALS[0] + 1)
+    hi = REFIX_ENDS[-1] if end is None else min(to_ordinals(end), REFIX_ENDS[-1])
+    days = np.arange(lo, hi + 1, dtype=np.int64)
+    return pd.DataFrame({
+        "Calculation Date": [date.fromordinal(int(d)) for d in days],
+        "HIBOR Refixing": refixing_rate(days),
+    })
+
+
+def _to_days(mit_days):
+    # MIT 天数：兼容 timedelta（页面）和 int / int 数组（批量）
+    if isinstance(mit_days, timedelta):
+        return mit_days.days
+    return np.asarray(mit_days, dtype=np.int64)
+
+
+def refixing_rate(d):
+    """日期 d 适用的重定价利率：上一个重定价日（不含当日）的利率；首个重定价日及之前或 2030 年后为 NaN"""
+    o = np.asarray(to_ordinals(d))
+    k = np.searchsorted(REFIX_ORDINALS, o, side="left") - 1
+    return np.where((k >= 0) & (o <= REFIX_ENDS[-1]), REFIX_RATES[np.maximum(k, 0)], np.nan)
+
+
+def _hibor_split(rates, sme_drawdown, repayment_date, mit_days):
+    """
+    返回 (放款日 HIBOR, 最后一个沿用放款日 HIBOR 的日期序号)：
+    - MIT 内还款或窗口内没有重定价日：整个窗口都用放款日 HIBOR
+    - 否则首个落在 [放款日, 还款日] 的重定价日（含）之前用放款日 HIBOR
+    """
+    sd = np.asarray(to_ordinals(sme_drawdown))
+    repay = np.asarray(to_ordinals(repayment_date))
+    drawdown_hibor = rates.value_at(HIBOR_COLUMN, sd)
+    k = np.searchsorted(REFIX_ORDINALS, sd, side="left")
+    first_hit = REFIX_ORDINALS[np.minimum(k, len(REFIX_ORDINALS) - 1)]
+    refixed = (k < len(REFIX_ORDINALS)) & (first_hit <= repay) & ((repay - sd + 1) > _to_days(mit_days))
+    return drawdown_hibor, np.where(refixed, first_hit, repay)
+
+
+# RateIndex -> 重定价前缀和；弱引用键，利率版本被替换、索引无人引用后随之释放
+_refix_prefixes = weakref.WeakKeyDictionary()
+
+
+def _refix_prefix(rates):
+    # 每个重定价区间（按利率表内实际存在的日期）的利率合计的前缀和
+    prefix = _refix_prefixes.get(rates)
+    if prefix is None:
+        counts = rates.day_count(REFIX_ORDINALS, REFIX_ENDS)
+        prefix = np.concatenate(([0.0], np.cumsum(REFIX_RATES * counts)))
+        prefix.flags.writeable = False
+        _refix_prefixes[rates] = prefix
+    return prefix
+
+
+def _refix_cumsum(rates, x):
+    # 利率表内 (首个重定价日, x] 的重定价利率合计
+    x = np.minimum(x, REFIX_ENDS[-1])
+    k = np.searchsorted(REFIX_ORDINALS, x, side="left") - 1
+    kk = np.maximum(k, 0)
+    part = _refix_prefix(rates)[kk] + REFIX_RATES[kk] * rates.day_count(REFIX_ORDINALS[kk], x)
+    return np.where(k >= 0, part, 0.0)
+
+
+def hibor_applied_rate(rates, sme_drawdown, repayment_date, mit_days, d):
+    """Applied HIBOR 在日期 d 的取值；d 不在 [放款日, 还款日] 或利率表无该日时为 NaN。参数均可为数组"""
+    sd = np.asarray(to_ordinals(sme_drawdown))
+    repay = np.asarray(to_ordinals(repayment_date))
+    d = np.asarray(to_ordinals(d))
+    drawdown_hibor, split = _hibor_split(rates, sd, repay, mit_days)
+    value = np.where(d <= split, drawdown_hibor, refixing_rate(d))
+    ok = (d >= sd) & (d <= repay) & (rates.day_count(d - 1, d) == 1)
+    return np.where(ok, value, np.nan)
+
+
+def hibor_applied_sum(rates, sme_drawdown, repayment_date, mit_days, start):
+    """
+    (start, repayment_date] 内 Applied HIBOR 的合计，窗口外（放款日之前）不计。
+    每笔只做几次 searchsorted 和前缀和查找，参数可为整本 HIBOR 交易的数组。
+    """
+    sd = np.asarray(to_ordinals(sme_drawdown))
+    repay = np.asarray(to_ordinals(repayment_date))
+    drawdown_hibor, split = _hibor_split(rates, sd, repay, mit_days)
+    lo = np.maximum(np.asarray(to_ordinals(start)), sd - 1)
+    mid = np.maximum(np.minimum(repay, split), lo)
+    a = np.maximum(lo, split)
+    b = np.maximum(repay, a)
+    return drawdown_hibor * rates.day_count(lo, mid) + (_refix_cumsum(rates, b) - _refix_cumsum(rates, a))
@@ -0,0 +1,106 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+import pandas as pd
+
+# Funder Balance：参考表（账户 / Funder / 币种）对上 DBS 余额和 LMS 余额
+FUNDER_PATH = "Tadata/funder_data.xlsx"
+DBS_COLUMNS = ["Account Number", "Currency", "Available Balance"]
+LMS_COLUMNS = ["Funder ID", "Currency", "Ledger Balance"]
+
+
+def _ccy(s: pd.Series) -> pd.Series:
+    return s.replace('CNH', 'CNY')  # 替换 CNH 为 CNY
+
+
+def _str(s: pd.Series) -> pd.Series:
+    return s.astype("string").str.strip()
+
+
+# ---------- 参考表：每个进程只读一次，文件修改时间变了才重读 ----------
+_funder_cache = {}   # 绝对路径 -> (mtime, DataFrame)
+
+
+def load_funder_format(path: str = FUNDER_PATH) -> pd.DataFrame:
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    hit = _funder_cache.get(path)
+    if hit is None or hit[0] != mtime:
+        df = pd.read_excel(path, dtype={"Account no.": str})
+        df["Account no."] = _str(df["Account no."])
+        hit = _funder_cache[path] = (mtime, df)
+    return hit[1].copy()
+
+
+# ---------- 上传文件：按内容 sha1 缓存解析结果（LRU） ----------
+_UPLOAD_CACHE_SIZE = 16
+_upload_cache = OrderedDict()   # (类型, sha1) -> Series
+_upload_lock = threading.Lock() # Streamlit 每个会话一个线程，缓存的读写都在锁内
+
+
+def parse_dbs(data: bytes, engine: str = "xlrd") -> pd.Series:
+    """DBS 余额表 -> 以 (Account Number, Currency) 为索引的 Available Balance"""
+    df = pd.read_excel(BytesIO(data), skiprows=2, engine=engine, usecols=DBS_COLUMNS,
+                       dtype={"Account Number": str})
+    df["Account Number"] = _str(df["Account Number"])
+    df["Currency"] = _ccy(df["Currency"])
+    return _indexed(df, DBS_COLUMNS)
+
+
+def parse_lms(data: bytes) -> pd.Series:
+    """LMS 余额表 -> 以 (Funder ID, Currency) 为索引的 Ledger Balance"""
+    df = pd.read_excel(BytesIO(data), usecols=LMS_COLUMNS)
+    df["Currency"] = _ccy(df["Currency"])
+    return _indexed(df, LMS_COLUMNS)
+
+
+def _indexed(df: pd.DataFrame, columns: list) -> pd.Series:
+    # 同一 (账户, 币种) 出现多次时取第一行，保证一对一对上参考表
+    s = df.set_index(columns[:2])[columns[2]]
+    return s[~s.index.duplicated(keep="first")]
+
+
+def _cached(kind: str, uploaded, parse) -> pd.Series:
+    data = uploaded.getvalue()
+    key = (kind, hashlib.sha1(data).hexdigest())
+    with _upload_lock:
+        hit = _upload_cache.get(key)
+        if hit is not None:
+            _upload_cache.move_to_end(key)
+            return hit
+
+    parsed = parse(data)   # 解析在锁外进行，不阻塞其他会话
+    with _upload_lock:
+        _upload_cache[key] = parsed
+        _upload_cache.move_to_end(key)
+        while len(_upload_cache) > _UPLOAD_CACHE_SIZE:
+            _upload_cache.popitem(last=False)
+    return parsed
+
+
+def load_dbs(uploaded) -> pd.Series:
+    return _cached("dbs", uploaded, parse_dbs)
+
+
+def load_lms(uploaded) -> pd.Series:
+    return _cached("lms", uploaded, parse_lms)
+
+
+def _lookup(balances: pd.Series, keys: pd.Series, currency: pd.Series):
+    index = pd.MultiIndex.from_arrays([keys, currency])
+    return balances.reindex(index).to_numpy()
+
+
+def fill_balances(funder_format: pd.DataFrame, bank: pd.Series = None, lms: pd.Series = None) -> pd.DataFrame:
+    """
+    按索引把余额填进参考表：Bank record <- (Account no., Currency)，LMS Amt <- (Funder list, Currency)。
+    参考表行数不变；没有上传的一侧保持原值。
+    """
+    df = funder_format.copy()
+    if bank is not None:
+        df["Bank record"] = _lookup(bank, _str(df["Account no."]), df["Currency"])
+    if lms is not None:
+        df["LMS Amt"] = _lookup(lms, df["Funder list"], df["Currency"])
+    return df
@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from utils.dic_data import defaults, hibor_applied_rate, hibor_applied_sum
+from utils.rate_index import RateIndex, to_ordinals
+
+# ------------------ 常量（与 Data Processor 页面一致） ------------------
+T0_ORDINAL = date(2025, 6, 23).toordinal()        # 此日及之后放款，计息起点提前一天
+NULL_ORDINAL = date(1999, 1, 1).toordinal()       # 页面上的“空日期”
+ZERO_INTRATE_FUNDER = ['FP0056', 'FP0000']
+RFPO_CODE = ['-IMP-RF', '-IMP-PO', '-LOG-RF', '-LOG-PO']
+THRESHOLD = 0.02
+
+DATE_FIELDS = ["sme_drawdown", "funder_drawdown", "last_funder_submission", "repayment_date"]
+
+
+# ------------------ 向量化的分类函数 ------------------
+def get_prdtype(drawdown_id: pd.Series) -> np.ndarray:
+    s = drawdown_id.fillna("").astype(str).str.strip().str.upper()
+    is_rfpo = s.str.startswith(("F-", "P-"))
+    for code in RFPO_CODE:
+        is_rfpo |= s.str.contains(code, regex=False)
+    return np.where(is_rfpo, "RFPO", "Regular")
+
+
+def get_funder_type(funder_id: pd.Series) -> np.ndarray:
+    return np.where(funder_id.isin(ZERO_INTRATE_FUNDER), "Zero", "Main")
+
+
+def get_rate_type(rate_info: pd.Series) -> np.ndarray:
+    s = rate_info.fillna("").astype(str).str.lower()
+    return np.select([s.str.contains("sofr", regex=False), s.str.contains("hibor", regex=False)],
+                     ["SOFR+", "HIBOR+"], "Fixed")
+
+
+def trunc(num, digits):
+    factor = 10 ** digits
+    return np.trunc(num * factor) / factor
+
+
+def _status_label(values, ok):
+    # 与页面一致："ok: 0.01" / "err: -3.5"
+    return np.array([f"{'ok' if o else 'err'}: {round(float(v), 2)}" for v, o in zip(values, ok)], dtype=object)
+
+
+def rate_version_note(version) -> str:
+    """Maker 表 Note 列：计算所用的利率版本（如 "Rate v3"），非利率库来源时为空"""
+    return "" if pd.isna(version) else f"Rate v{int(version)}"
+
+
+def check_differences(system, calculation, threshold=THRESHOLD):
+    gap = np.abs(calculation - system)
+    return gap, _status_label(calculation - system, gap < threshold)
+
+
+# ------------------ 浮动利率区间求和 ------------------
+def _float_sums(rates: RateIndex, ratetype, sd, repay, mit, starts):
+    """按利率类型取 starts 各起点到 repay 的浮动利率合计，以及 repay 当日利率"""
+    sums = [rates.range_sum("SOFR", s, repay) for s in starts]
+    repay_rate = rates.value_at("SOFR", repay)
+    is_hibor = ratetype == "HIBOR+"
+    if is_hibor.any():
+        h_sums = [hibor_applied_sum(rates, sd, repay, mit, s) for s in starts]
+        h_rate = hibor_applied_rate(rates, sd, repay, mit, repay)
+        sums = [np.where(is_hibor, h, s) for h, s in zip(h_sums, sums)]
+        repay_rate = np.where(is_hibor, h_rate, repay_rate)
+    return sums, repay_rate
+
+
+# ------------------ 批量计算主函数 ------------------
+def compute_interest(trades: pd.DataFrame, rates: RateIndex) -> pd.DataFrame:
+    """
+    批量复现 Data Processor 的“Calculation Part”。
+    trades：每行一笔交易，列名同 utils.dic_data.defaults（parse_lms_to_dic 的输出）；
+    可选列 opstype / xdj / fundertype / ratetype / prdtype 覆盖自动判断（对应页面侧边栏与开关）。
+    返回与 trades 同索引的结果表：利息、平台费、Spreading、三项 checker 差额，以及所用利率版本 rate_version。
+    """
+    df = trades.copy()
+    for k, v in defaults.items():
+        if k not in df.columns:
+            df[k] = v
+        else:
+            df[k] = df[k].where(df[k].notna(), v)
+    n = len(df)
+
+    opstype = df["opstype"].to_numpy() if "opstype" in df else np.full(n, "Repayment")
+    xdj = df["xdj"].fillna(False).to_numpy(dtype=bool) if "xdj" in df else np.zeros(n, dtype=bool)
+    fundertype = df["fundertype"].to_numpy() if "fundertype" in df else get_funder_type(df["funder_id"])
+    ratetype = df["ratetype"].to_numpy() if "ratetype" in df else get_rate_type(df["sme_intrate"])
+    prdtype = df["prdtype"].to_numpy() if "prdtype" in df else get_prdtype(df["drawdown_id"])
+
+    num = {k: pd.to_numeric(df[k], errors="coerce").to_numpy(dtype=float) for k, v in defaults.items()
+           if isinstance(v, (int, float))}
+    sd, fd, lfs, repay = (to_ordinals(df[k].to_numpy()) for k in DATE_FIELDS)
+    tenor = num["sme_tenor"].astype(np.int64)
+    mit = num["sme_mit"].astype(np.int64)
+
+    # 资金方利率为 0 时，取利率描述里的最后一个数字
+    rate = num["funder_intrate"]
+    fallback = pd.to_numeric(df["sme_intrate"].astype(str).str.findall(r"\d+\.?\d*").str[-1], errors="coerce")
+    rate = np.where(rate == 0, fallback.to_numpy(dtype=float), rate)
+
+    # ---------- 日期 ----------
+    expected_repaydate = sd + tenor
+    sd_cal = np.where(sd >= T0_ORDINAL, sd - 1, sd)
+    mit_repaydate = sd_cal + mit
+    fd_cal = np.where(fd >= T0_ORDINAL, fd - 1, fd)
+    repay = np.where((opstype == "Rollover") & (repay != fd), repay - 1, repay)
+
+    is_rfpo = prdtype == "RFPO"
+    is_fixed = ratetype == "Fixed"
+    principal_cal = np.where(is_rfpo, num["outstanding_principal"], num["principal"])
+    sd_cal = np.where(is_rfpo & (lfs != NULL_ORDINAL), lfs, sd_cal)
+
+    # ---------- SME 利息 ----------
+    (regul_floatsum, overduesum, funder_floatsum), repay_rate = _float_sums(
+        rates, ratetype, sd, repay, mit, [sd_cal, expected_repaydate, fd_cal])
+    hdays = repay - sd_cal
+    # 计息区间内缺利率的天数（浮动利率才有影响），用于提示而不是在计算中途报错
+    accrual_start = np.where(is_rfpo | (fd_cal == sd_cal), sd_cal, np.minimum(sd_cal, fd_cal))
+    rate_gap_days = np.where(is_fixed, 0, rates.missing_count(accrual_start, repay))
+    is_mit = repay <= mit_repaydate
+    is_overdue = ~is_mit & (repay > expected_repaydate)
+    note = np.select([is_mit, is_overdue], ["MIT", "Overdue"], "Normal")
+
+    floatsum = np.where(is_mit, (mit - hdays) * repay_rate + regul_floatsum, regul_floatsum)
+    hdays = np.where(is_mit, mit, hdays)
+    floatsum = np.where(is_fixed, 0.0, floatsum)
+    overduesum = np.where(is_fixed, 0.0, overduesum)
+    overdue_hdays = repay - expected_repaydate
+
+    sme_interest = trunc((floatsum + rate * hdays) / 360 * principal_cal * 0.01, 2)
+    overdue_interest = trunc((overduesum + rate * overdue_hdays) / 360 * principal_cal * 0.01, 2)
+    overdue_interest = np.where(is_overdue & ~is_rfpo, overdue_interest, 0.0)
+    sme_allinterest = sme_interest + overdue_interest
+
+    # ---------- Funder 利息 ----------
+    funder_hdays = repay - fd_cal
+    funder_floatsum = np.where(is_fixed, 0.0, funder_floatsum)
+    funder_regulint = trunc((funder_floatsum + rate * funder_hdays) / 360 * principal_cal * 0.01, 2)
+    funder_interest = np.where(fd <= expected_repaydate, funder_regulint + overdue_interest, funder_regulint * 2)
+    funder_interest = np.where(is_rfpo | (fd_cal == sd_cal), sme_allinterest, funder_interest)
+
+    # ---------- 分配（豁免 / 附加费 / 平台费 / 小店金） ----------
+    waived_interest = -(num["waived_smeint"] + num["waived_smeodint"])
+    waived_bankcharge = -num["waived_bankcharge"]
+    surcharge = num["surcharge_item"]
+    is_main = fundertype == "Main"
+
+    before_fee = np.where(xdj, funder_interest, funder_interest + surcharge - waived_interest)
+    before_fee = np.where(~xdj & (before_fee >= waived_bankcharge) & is_main,
+                          before_fee - waived_bankcharge, before_fee)
+    platform_fee = np.where(num["platform_fee"] != 0, before_fee * 0.01, 0.0)
+    funder_interest = np.where(xdj, before_fee + surcharge, before_fee)
+    funder_interest = np.where(xdj & (funder_interest >= waived_bankcharge) & is_main,
+                               funder_interest - waived_bankcharge, funder_interest)
+    funder_interest = np.where(fundertype == "Zero", 0.0, funder_interest)
+
+    spreading = sme_allinterest + surcharge - waived_bankcharge - waived_interest - funder_interest
+
+    # ---------- Checker ----------
+    smegap, sme_checker = check_differences(num["sme_sysint"] + num["sme_sysodint"], sme_allinterest)
+    fundergap, funder_checker = check_differences(num["funder_sysint"], funder_interest)
+    spreadinggap, spreading_checker = check_differences(num["spreading_sysint"], spreading)
+    mxgap = np.maximum.reduce([smegap, fundergap, spreadinggap])
+    checker = _status_label(mxgap, mxgap < THRESHOLD)
+
+    return pd.DataFrame({
+        "fundertype": fundertype,
+        "ratetype": ratetype,
+        "prdtype": prdtype,
+        "note": note,
+        "funder_intrate": rate,
+        "regul_floatsum": regul_floatsum,
+        "rate_gap_days": rate_gap_days,
+        "sme_interest": sme_interest,
+        "overdue_interest": overdue_interest,
+        "sme_allinterest": sme_allinterest,
+        "funder_interest": funder_interest,
+        "platform_fee": platform_fee,
+        "spreading": spreading,
+        "smegap": smegap,
+        "sme_checker": sme_checker,
+        "fundergap": fundergap,
+        "funder_checker": funder_checker,
+        "spreadinggap": spreadinggap,
+        "spreading_checker": spreading_checker,
+        "mxgap": mxgap,
+        "checker": checker,
+        "rate_version": rates.version,
+    }, index=df.index)
@@ -0,0 +1,231 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import msoffcrypto
+import pandas as pd
+
+LIANLIAN_PASSWORD = "llqbd2019"
+
+# 只读页面用到的表和列：Summary 的扣款信息 + 四位数字表名（如 0701）的交易明细
+SUMMARY_SHEET = "Summary"
+DEDUCTION_MARKER = "Deduction"   # 有 Deduction 表时才读 Summary 的扣款列
+DEDUCTION_COLUMNS = ["Company Name", "Deduction Amount", "Deduction Date"]
+TRADE_SHEET_PATTERN = re.compile(r"\d{4}")
+TRADE_COLUMNS = ["Seller Name", "Trade Code", "Settle", "TRUNC P", "Repaid Loan P"]
+
+
+def decrypt_workbook(data: bytes, password: str = LIANLIAN_PASSWORD) -> bytes:
+    """解密连连的加密 Excel，返回明文 xlsx 字节"""
+    office_file = msoffcrypto.OfficeFile(BytesIO(data))
+    office_file.load_key(password=password)
+    decrypted = BytesIO()
+    office_file.decrypt(decrypted)
+    return decrypted.getvalue()
+
+
+def is_trade_sheet(name: str) -> bool:
+    return TRADE_SHEET_PATTERN.fullmatch(name.replace(" ", "")) is not None
+
+
+def _read_columns(xl: pd.ExcelFile, names: list, columns: list) -> dict:
+    # 在已打开的工作簿上读多张表，只保留需要的列
+    wanted = set(columns)
+    return xl.parse(sheet_name=names, usecols=lambda c: c in wanted)
+
+
+def read_trades(xl: pd.ExcelFile, names: list) -> pd.DataFrame:
+    """
+    逐表读取交易表（同一个只读句柄）：只保留 TRUNC P 和 Repaid Loan P 都有值的行，加上 Sheet Name 列，
+    按表顺序一次性合并。缺少这两列的表跳过。
+    """
+    frames = []
+    for name, df in _read_columns(xl, names, TRADE_COLUMNS).items():
+        if 'TRUNC P' in df.columns and 'Repaid Loan P' in df.columns:
+            df = df[df['TRUNC P'].notna() & df['Repaid Loan P'].notna()]
+            if not df.empty:
+                frames.append(df.assign(**{"Sheet Name": name}))
+    if not frames:
+        return pd.DataFrame(columns=TRADE_COLUMNS + ["Sheet Name"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_workbook(decrypted: bytes) -> dict:
+    """
+    只打开一次工作簿（openpyxl 只读句柄，表按需逐张解析），先列出表名，再只读需要的表和列，返回：
+      sheet_names: 全部表名
+      deduction:   Summary 的扣款列（没有 Deduction 表时为 None）
+      trades:      全部交易表合并后的明细
+    串行读取：按进程拆分要把整本工作簿传给每个进程，实测没有收益。
+    """
+    with pd.ExcelFile(BytesIO(decrypted), engine="openpyxl") as xl:
+        names = list(xl.sheet_names)
+        deduction = None
+        if DEDUCTION_MARKER in names:
+            deduction = _read_columns(xl, [SUMMARY_SHEET], DEDUCTION_COLUMNS)[SUMMARY_SHEET]
+        trades = read_trades(xl, [n for n in names if is_trade_sheet(n)])
+    return {"sheet_names": names, "deduction": deduction, "trades": trades}
+
+
+# ---------- 按文件内容哈希缓存（解密结果 + 读出的表），按占用字节数 LRU 淘汰 ----------
+_LIANLIAN_CACHE_BYTES = 256 * 1024 * 1024
+_lianlian_cache = OrderedDict()   # sha1 -> (解密字节, read_workbook 结果, 占用字节数)
+_lianlian_cache_used = 0          # 缓存中各项占用字节数之和（随放入 / 淘汰增减，不每次重算）
+_lianlian_lock = threading.Lock() # Streamlit 每个会话一个线程，缓存和计数的读写都在锁内
+
+
+def _nbytes(decrypted: bytes, parsed: dict) -> int:
+    frames = [v for v in parsed.values() if isinstance(v, pd.DataFrame)]
+    return len(decrypted) + sum(int(df.memory_usage(index=True, deep=True).sum()) for df in frames)
+
+
+def _read_bytes(uploaded) -> bytes:
+    # Streamlit UploadedFile / 文件对象 / 路径 / bytes
+    if isinstance(uploaded, (bytes, bytearray)):
+        return bytes(uploaded)
+    if hasattr(uploaded, "getvalue"):
+        return uploaded.getvalue()
+    if hasattr(uploaded, "read"):
+        uploaded.seek(0)
+        return uploaded.read()
+    with open(uploaded, "rb") as f:
+        return f.read()
+
+
+def _cache_get(key: str):
+    with _lianlian_lock:
+        hit = _lianlian_cache.get(key)
+        if hit is None:
+            return None
+        _lianlian_cache.move_to_end(key)
+        return hit[1]
+
+
+def _cache_put(key: str, decrypted: bytes, parsed: dict):
+    global _lianlian_cache_used
+    size = _nbytes(decrypted, parsed)   # 统计占用在锁外进行
+    with _lianlian_lock:
+        old = _lianlian_cache.pop(key, None)
+        if old is not None:
+            _lianlian_cache_used -= old[2]
+        _lianlian_cache[key] = (decrypted, parsed, size)
+        _lianlian_cache_used += size
+        # 超出上限时淘汰最久未用的（至少保留刚放入的这一个）
+        while len(_lianlian_cache) > 1 and _lianlian_cache_used > _LIANLIAN_CACHE_BYTES:
+            _, (_, _, evicted) = _lianlian_cache.popitem(last=False)
+            _lianlian_cache_used -= evicted
+
+
+def _copy(parsed: dict) -> dict:
+    return {k: v.copy() if isinstance(v, (pd.DataFrame, list)) else v for k, v in parsed.items()}
+
+
+def load_lianlian(uploaded) -> dict:
+    """
+    解密并读取连连 Excel（结构见 read_workbook）。
+    结果按上传文件内容的 sha1 缓存：同一个文件在页面重跑时不再解密和解析。
+    返回的是副本，调用方可以随意修改。
+    """
+    data = _read_bytes(uploaded)
+    key = hashlib.sha1(data).hexdigest()
+    parsed = _cache_get(key)
+    if parsed is None:
+        decrypted = decrypt_workbook(data)
+        parsed = read_workbook(decrypted)
+        _cache_put(key, decrypted, parsed)
+    return _copy(parsed)
+
+
+# ---------- 月末批量：多个工作簿并行解密、读取，合并成一张明细 ----------
+def _file_name(uploaded) -> str:
+    name = getattr(uploaded, "name", None) or (uploaded if isinstance(uploaded, str) else "workbook.xlsx")
+    return os.path.basename(name)
+
+
+def _unique_labels(names: list) -> list:
+    """文件名作为列名 / 来源标记：重名的依次加 (2)、(3)…，避免不同文件在汇总里合并成一列"""
+    used, out = {"Total"}, []   # Total 是 seller_totals 的合计列
+    for name in names:
+        label, n = name, 1
+        while label in used:
+            n += 1
+            label = f"{name} ({n})"
+        used.add(label)
+        out.append(label)
+    return out
+
+
+def _load_one(task: tuple) -> tuple:
+    """单个工作簿（进程池任务，只传加密字节和密码）：返回 (解密字节, read_workbook 结果, 错误信息或 None)"""
+    data, password = task
+    try:
+        decrypted = decrypt_workbook(data, password)
+        return decrypted, read_workbook(decrypted), None
+    except Exception as e:
+        return None, None, f"{type(e).__name__}: {e}"
+
+
+def load_lianlian_batch(files: list, password: str = LIANLIAN_PASSWORD, workers: int = None) -> tuple:
+    """
+    批量读取多个连连 Excel：缓存里没有的文件放进进程池，每个文件一个任务（与单文件共用缓存）。
+    解密是纯 CPU 计算，任务只带加密字节；每个工作簿在进程内仍只开一个只读句柄。
+    返回 (合并明细, 每个文件的汇总)：
+      明细 = 各文件 trades 按上传顺序合并，第一列 File 记录来源文件（重名文件加序号区分）；
+      汇总 = File / Sheets / Trades / TRUNC P / Error，单个文件出错不影响其他文件。
+    内容相同的文件只读一次、只计一次。
+    """
+    datas = [_read_bytes(f) for f in files]
+    names = _unique_labels([_file_name(f) for f in files])
+    keys = [hashlib.sha1(d).hexdigest() for d in datas]
+
+    parsed, errors, todo = {}, {}, {}
+    for k, data in zip(keys, datas):
+        if k in parsed or k in todo:
+            continue
+        hit = _cache_get(k)
+        if hit is not None:
+            parsed[k] = hit
+        else:
+            todo[k] = (data, password)
+    workers = min(workers or os.cpu_count() or 1, len(todo)) if todo else 1
+    if workers <= 1:
+        outputs = [_load_one(t) for t in todo.values()]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outputs = list(pool.map(_load_one, todo.values()))
+    for k, (decrypted, result, error) in zip(todo, outputs):
+        if error is None:
+            _cache_put(k, decrypted, result)
+            parsed[k] = result
+        else:
+            errors[k] = error
+
+    frames, summary, seen = [], [], {}
+    for name, k in zip(names, keys):
+        row = {"File": name, "Sheets": 0, "Trades": 0, "TRUNC P": 0.0, "Error": errors.get(k, "")}
+        if k in seen:
+            # 同一内容重复上传：只计一次，避免付款金额翻倍
+            row["Error"] = f"Same content as {seen[k]}, skipped"
+        elif k in parsed:
+            seen[k] = name
+            trades = parsed[k]["trades"]
+            row.update({"Sheets": int(trades["Sheet Name"].nunique()), "Trades": len(trades),
+                        "TRUNC P": float(pd.to_numeric(trades["TRUNC P"], errors="coerce").sum())})
+            frames.append(trades.assign(File=name))
+        summary.append(row)
+
+    columns = ["File"] + TRADE_COLUMNS + ["Sheet Name"]
+    merged = pd.concat(frames, ignore_index=True).reindex(columns=columns) if frames else pd.DataFrame(columns=columns)
+    return merged, pd.DataFrame(summary)
+
+
+def seller_totals(trades: pd.DataFrame) -> pd.DataFrame:
+    """按 Seller Name 汇总 TRUNC P：每个来源文件（File 标记，已去重名）一列，最后一列 Total"""
+    values = trades.assign(**{"TRUNC P": pd.to_numeric(trades["TRUNC P"], errors="coerce")})
+    table = values.pivot_table(index="Seller Name", columns="File", values="TRUNC P",
+                               aggfunc="sum", fill_value=0.0, sort=False)
+    table["Total"] = table.sum(axis=1)
+    return table.reset_index().rename_axis(columns=None)
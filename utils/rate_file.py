@@ -0,0 +1,138 @@
+import os
+import json
+import mmap
+import struct
+import numpy as np
+
+from utils.rate_index import RateIndex, _SCALE
+
+# 利率快照的二进制文件：一个版本一个文件，发布后不再改写；各进程 mmap 后零拷贝读数组，无需解析 CSV / 查库
+# 布局：MAGIC(8) + 头长度(uint32) + JSON 头 + 补齐到 64 字节；之后是各数组（每个都按 64 字节对齐）
+# JSON 头：base（第一天 ordinal）、size、version、columns、scale，以及 arrays: 名称 -> [偏移, dtype, 长度]
+MAGIC = b"RATEIDX\x01"
+_ALIGN = 64
+
+
+def rate_file_path(db_path: str, version: int) -> str:
+    """Tadata/rates.sqlite 的版本 3 -> Tadata/rates.v3.bin"""
+    return f"{os.path.splitext(db_path)[0]}.v{int(version)}.bin"
+
+
+def _arrays(index: RateIndex) -> dict:
+    # 名称 -> 数组（值、定点累计和按列，另加有值天数累计和与缺失标记）
+    out = {}
+    for col in index.columns:
+        out[f"values/{col}"] = np.ascontiguousarray(index._values[col], dtype=np.float64)
+        out[f"cum/{col}"] = np.ascontiguousarray(index._cum[col], dtype=np.int64)
+    out["days"] = np.ascontiguousarray(index._days, dtype=np.int64)
+    out["missing"] = np.ascontiguousarray(index.missing, dtype=np.bool_)
+    return out
+
+
+def _pad(n: int) -> int:
+    return -n % _ALIGN
+
+
+def write_rate_file(index: RateIndex, path: str) -> str:
+    """
+    把 RateIndex 写成二进制快照：先写同目录临时文件并 fsync，再 os.replace 原子替换。
+    已经映射旧文件的进程不受影响（旧 inode 仍然有效）。
+    """
+    arrays = _arrays(index)
+    layout, offset = {}, 0
+    for name, arr in arrays.items():
+        layout[name] = [offset, arr.dtype.str, len(arr)]
+        offset += arr.nbytes + _pad(arr.nbytes)
+    header = json.dumps({
+        "base": int(index.base), "size": int(index.size), "version": index.version,
+        "columns": index.columns, "scale": _SCALE, "arrays": layout,
+    }).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    prefix += b"\0" * _pad(len(prefix))
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(prefix)
+        for arr in arrays.values():
+            f.write(arr.tobytes())
+            f.write(b"\0" * _pad(arr.nbytes))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def _read_header(path: str) -> tuple:
+    # 返回 (JSON 头, 数组区起始偏移)；不是快照文件、头被截断或无法解析时报 ValueError
+    with open(path, "rb") as f:
+        head = f.read(len(MAGIC) + 4)
+        if len(head) < len(MAGIC) + 4 or head[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a rate file: {path}")
+        (n,) = struct.unpack("<I", head[len(MAGIC):])
+        raw = f.read(n)
+    if len(raw) != n:
+        raise ValueError(f"Rate file {path} is truncated (header)")
+    try:
+        header = json.loads(raw.decode("utf-8"))
+    except ValueError as e:   # JSONDecodeError / UnicodeDecodeError
+        raise ValueError(f"Rate file {path} has a corrupt header: {e}") from None
+    if not isinstance(header, dict) or not {"base", "size", "version", "columns", "scale", "arrays"} <= header.keys():
+        raise ValueError(f"Rate file {path} has an incomplete header")
+    start = len(MAGIC) + 4 + n
+    return header, start + _pad(start)
+
+
+def read_header(path: str) -> dict:
+    """只读文件头（不映射数组）"""
+    return _read_header(path)[0]
+
+
+def _check_layout(header: dict, start: int, file_size: int, path: str):
+    # 每个数组都要完整落在文件内，且长度与 size 对得上：截断或改写过的文件在映射前就报错
+    size = header["size"]
+    if not isinstance(size, int) or size < 0 or not isinstance(header["columns"], list):
+        raise ValueError(f"Rate file {path} has an invalid header")
+    expected = {"missing": size, "days": size + 1}
+    for col in header["columns"]:
+        expected[f"values/{col}"] = size
+        expected[f"cum/{col}"] = size + 1
+    for name, length in expected.items():
+        try:
+            offset, dtype, count = header["arrays"][name]
+            itemsize = np.dtype(dtype).itemsize
+            if not isinstance(offset, int) or not isinstance(count, int):
+                raise TypeError
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Rate file {path} has no valid entry for array {name!r}") from None
+        if count != length:
+            raise ValueError(f"Rate file {path}: array {name!r} has {count} items, expected {length}")
+        if offset < 0 or start + offset + count * itemsize > file_size:
+            raise ValueError(f"Rate file {path} is truncated: array {name!r} ends past {file_size} bytes")
+
+
+def open_rate_file(path: str) -> RateIndex:
+    """
+    以只读 mmap 打开快照，返回直接引用映射内存的 RateIndex（不复制、不重算）。
+    打开开销与历史长度无关；多个进程映射同一文件时共享同一份页缓存。
+    文件头或大小与数组布局不符（截断、损坏、非本程序写入）时报 ValueError。
+    """
+    header, start = _read_header(path)
+    if header["scale"] != _SCALE:
+        raise ValueError(f"Rate file {path} uses scale {header['scale']}, expected {_SCALE}")
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _check_layout(header, start, len(mm), path)
+
+    def array(name):
+        offset, dtype, length = header["arrays"][name]
+        return np.frombuffer(mm, dtype=np.dtype(dtype), count=length, offset=start + offset)
+
+    columns = header["columns"]
+    return RateIndex.from_arrays(
+        header["base"],
+        {col: array(f"values/{col}") for col in columns},
+        {col: array(f"cum/{col}") for col in columns},
+        array("missing"),
+        array("days"),
+        header["version"],
+    )
@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+
+# 基准利率列（Applied HIBOR 不入表：按笔由放款日 HIBOR 和重定价表推出，见 utils.dic_data.hibor_applied_sum）
+RATE_COLUMNS = ["SOFR", "Daily Calculated Blended HIBOR"]
+
+# 定点倍数：利率最多 8 位小数，用整数累计和保证区间求和无浮点误差
+_SCALE = 10 ** 8
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def to_ordinals(values):
+    """
+    把日期（标量或数组）转成 date.toordinal() 序号。
+    - 支持 datetime.date / datetime / Timestamp / datetime64 / 已是整数的序号
+    - 标量返回 int，数组返回 int64 ndarray
+    """
+    if isinstance(values, date):
+        return values.toordinal()
+    if isinstance(values, (int, np.integer)):
+        return int(values)
+    arr = np.asarray(values)
+    if arr.dtype.kind in "iu":
+        return arr.astype(np.int64)
+    if arr.dtype.kind != "M":
+        arr = pd.to_datetime(pd.Series(arr.ravel())).to_numpy().reshape(arr.shape)
+    return arr.astype("datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL
+
+
+class RateIndex:
+    """
+    稠密日历利率表：以 date.toordinal() - base 为下标，每列一个按天排列的数组。
+    - value_at：单日取值 O(1)，无需扫描
+    - range_sum(col, a, b) 等价于 sofr_df.loc[(Calculation Date > a) & (<= b), col].sum()，两次前缀和查找
+    - missing：原始表中缺失的日期（载入时即可发现，不必等到计算时报错）
+    - fill="ffill" 时缺失日沿用前一日利率，并计入区间求和；默认不填充（缺失日按 0 计，与 pandas 一致）
+    - version：来源于利率库的快照版本号（utils.rate_store），计算结果据此记录所用利率版本
+    """
+
+    def __init__(self, base: int, values: dict, present: np.ndarray, missing: np.ndarray = None,
+                 version: int = None):
+        self.base = base                     # 第一天的 ordinal
+        self.version = version               # 利率快照版本号（非利率库来源时为 None）
+        self.size = len(present)             # 覆盖的自然日天数
+        self._values = values                # 列名 -> 稠密日利率（无值为 NaN）
+        self.missing = ~present if missing is None else missing  # 原始表缺失的日期
+        self._days = np.concatenate(([0], np.cumsum(present, dtype=np.int64)))
+        self._cum = {                        # 列名 -> 定点累计和（长度 size+1）
+            col: np.concatenate(([0], np.cumsum(np.rint(np.nan_to_num(v) * _SCALE).astype(np.int64))))
+            for col, v in values.items()
+        }
+        # 只读：同一个索引由所有会话共享（utils.rate_store.shared_rate_index），不允许任何一方改写
+        for arr in (*self._values.values(), *self._cum.values(), self.missing, self._days):
+            arr.flags.writeable = False
+
+    @classmethod
+    def from_arrays(cls, base: int, values: dict, cum: dict, missing: np.ndarray, days: np.ndarray,
+                    version: int = None) -> "RateIndex":
+        """
+        直接用已算好的数组建立索引（utils.rate_file 的内存映射），不复制、不重算前缀和。
+        数组须与 __init__ 算出的一致：cum / days 长度 size+1，且均为只读。
+        """
+        self = cls.__new__(cls)
+        self.base = base
+        self.version = version
+        self.size = len(missing)
+        self._values = values
+        self.missing = missing
+        self._days = days
+        self._cum = cum
+        return self
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, columns=None, date_col: str = "Calculation Date",
+                   fill: str = None, version: int = None) -> "RateIndex":
+        """
+        从 sofr_df 建立日历；columns 默认取 RATE_COLUMNS 中存在的列。
+        同一天出现多行时保留最后一行（与 DataSettings 的去重规则一致）。
+        """
+        if columns is None:
+            columns = [c for c in RATE_COLUMNS if c in df.columns]
+        df = df.loc[pd.notna(df[date_col])]
+
+        ords = to_ordinals(df[date_col].to_numpy()) if len(df) else np.empty(0, dtype=np.int64)
+        keep = ~pd.Series(ords).duplicated(keep="last").to_numpy()
+        df, ords = df.loc[keep], ords[keep]
+        base = int(ords.min()) if len(ords) else 0
+        size = int(ords.max()) - base + 1 if len(ords) else 0
+        pos = ords - base
+
+        present = np.zeros(size, dtype=bool)
+        present[pos] = True
+        values = {}
+        for col in columns:
+            dense = np.full(size, np.nan)
+            dense[pos] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+            values[col] = dense
+
+        missing = ~present
+        if fill == "ffill":
+            values = {col: pd.Series(v).ffill().to_numpy() for col, v in values.items()}
+            present = np.ones(size, dtype=bool)
+        elif fill is not None:
+            raise ValueError(f"Unknown fill policy: {fill}")
+        return cls(base, values, present, missing, version)
+
+    @property
+    def columns(self) -> list:
+        return list(self._values)
+
+    @property
+    def first_date(self):
+        return date.fromordinal(self.base) if self.size else None
+
+    @property
+    def last_date(self):
+        return date.fromordinal(self.base + self.size - 1) if self.size else None
+
+    def gaps(self) -> list:
+        """原始表中缺失的连续日期段 [(起, 止), ...]"""
+        edges = np.diff(np.concatenate(([0], self.missing.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        return [(date.fromordinal(self.base + int(a)), date.fromordinal(self.base + int(b)))
+                for a, b in zip(starts, ends)]
+
+    def _pos(self, d):
+        # 日期 d 之后（含 d）的累计位置，越界时截断到两端
+        return np.clip(to_ordinals(d) - self.base + 1, 0, self.size)
+
+    def _diff(self, arr, start, end):
+        lo = self._pos(start)
+        hi = np.maximum(self._pos(end), lo)  # end <= start 时为空区间
+        return arr[hi] - arr[lo]
+
+    def range_sum(self, column: str, start, end):
+        """(start, end] 区间内该列的合计；start/end 可为标量或等长数组"""
+        return self._diff(self._cum[column], start, end) / _SCALE
+
+    def day_count(self, start, end):
+        """(start, end] 区间内有利率的日期个数"""
+        return self._diff(self._days, start, end)
+
+    def missing_count(self, start, end):
+        """(start, end] 区间内没有利率的自然日个数（含超出表范围的日期）"""
+        span = np.maximum(np.asarray(to_ordinals(end)) - np.asarray(to_ordinals(start)), 0)
+        return span - self.day_count(start, end)
+
+    def value_at(self, column: str, d):
+        """取某日的利率（O(1)）；表内无该日或该值为空时返回 NaN"""
+        pos = np.asarray(to_ordinals(d)) - self.base
+        inside = (pos >= 0) & (pos < self.size)
+        if self.size:
+            out = np.where(inside, self._values[column][np.clip(pos, 0, self.size - 1)], np.nan)
+        else:
+            out = np.full(pos.shape, np.nan)
+        return float(out) if out.ndim == 0 else out
@@ -0,0 +1,239 @@
+import os
+import sqlite3
+import time
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from utils.rate_index import RateIndex
+from utils.rate_file import rate_file_path, write_rate_file, open_rate_file, read_header
+
+# 利率库：SQLite，日期以 date.toordinal() 整数存储，利率为 REAL
+# 每次上传发布一个新版本；行只追加不修改，所以版本 v 的快照（version <= v 的全部行）发布后永远不变
+# 每个版本另存一份内存映射的二进制快照（utils.rate_file，如 Tadata/rates.v3.bin），各进程零拷贝共享
+DB_PATH = "Tadata/rates.sqlite"
+CSV_PATH = "Tadata/updated_df.csv"   # 首次建库时的种子数据，也是导出格式
+
+# CSV 列名 -> 库内列名
+COLUMN_MAP = {
+    "SOFR": "sofr",
+    "SOFR Date": "sofr_date",
+    "Daily Calculated Blended HIBOR": "hibor",
+}
+DATE_COLUMNS = {"SOFR Date"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rates (
+    ordinal   INTEGER PRIMARY KEY,   -- Calculation Date
+    sofr      REAL,
+    sofr_date INTEGER,
+    hibor     REAL,
+    version   INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS versions (
+    version      INTEGER PRIMARY KEY,
+    published_at TEXT NOT NULL,
+    last_ordinal INTEGER NOT NULL,
+    row_count    INTEGER NOT NULL
+);
+"""
+
+
+def _read_seed_csv(csv_path: str) -> pd.DataFrame:
+    df = pd.read_csv(csv_path)
+    df["Calculation Date"] = pd.to_datetime(df["Calculation Date"], errors="coerce", dayfirst=False).dt.date
+    return df
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _migrate(conn: sqlite3.Connection):
+    # 旧库没有 version 列 / versions 表：已有数据记为版本 1
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(rates)")]
+    if "version" not in cols:
+        conn.execute("ALTER TABLE rates ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    if latest_version(conn) is None:
+        last, count = conn.execute("SELECT MAX(ordinal), COUNT(*) FROM rates").fetchone()
+        if count:
+            conn.execute("INSERT OR IGNORE INTO versions VALUES (1, ?, ?, ?)", (_now(), last, count))
+
+
+def connect(db_path: str = DB_PATH, seed_csv: str = CSV_PATH) -> sqlite3.Connection:
+    """
+    打开利率库（WAL 模式：发布新版本时读者不被阻塞，也读不到写了一半的数据）。
+    库为空且种子 CSV 存在时，先把 CSV 发布为版本 1。
+    """
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    _migrate(conn)
+    if latest_version(conn) is None and seed_csv and os.path.exists(seed_csv):
+        append_rates(_read_seed_csv(seed_csv), db_path, conn=conn)
+    return conn
+
+
+def latest_version(conn: sqlite3.Connection):
+    """最新已发布的版本号；空库为 None"""
+    (v,) = conn.execute("SELECT MAX(version) FROM versions").fetchone()
+    return v
+
+
+def last_date(conn: sqlite3.Connection, version: int = None):
+    """某版本（默认最新）的最后一个 Calculation Date"""
+    if version is None:
+        (o,) = conn.execute("SELECT MAX(ordinal) FROM rates").fetchone()
+    else:
+        (o,) = conn.execute("SELECT MAX(ordinal) FROM rates WHERE version <= ?", (version,)).fetchone()
+    return None if o is None else date.fromordinal(o)
+
+
+def list_versions(db_path: str = DB_PATH) -> pd.DataFrame:
+    """已发布的版本（新到旧）：版本号、发布时间、该版本最后日期、该版本新增行数"""
+    conn = connect(db_path)
+    try:
+        rows = conn.execute("SELECT version, published_at, last_ordinal, row_count "
+                            "FROM versions ORDER BY version DESC").fetchall()
+    finally:
+        conn.close()
+    df = pd.DataFrame(rows, columns=["Version", "Published At", "Last Date", "Rows Added"])
+    df["Last Date"] = pd.Series([date.fromordinal(o) for o in df["Last Date"]], dtype=object)
+    return df
+
+
+def _to_rows(df: pd.DataFrame) -> list:
+    # DataFrame -> [(ordinal, sofr, sofr_date, hibor), ...]，空值写 NULL
+    df = df.loc[pd.notna(df["Calculation Date"])]
+    out = pd.DataFrame({"ordinal": pd.to_datetime(df["Calculation Date"]).map(date.toordinal).tolist()})
+    for name in COLUMN_MAP:
+        if name not in df.columns:
+            out[name] = None
+        elif name in DATE_COLUMNS:
+            ts = pd.to_datetime(df[name], errors="coerce")
+            out[name] = [None if pd.isna(t) else t.toordinal() for t in ts]
+        else:
+            v = pd.to_numeric(df[name], errors="coerce")
+            out[name] = [None if pd.isna(x) else float(x) for x in v]
+    return list(out.itertuples(index=False, name=None))
+
+
+def append_rates(df: pd.DataFrame, db_path: str = DB_PATH, conn: sqlite3.Connection = None):
+    """
+    发布新版本：只写入晚于库内最后日期的行（同一天多行保留最后一行）。
+    分配版本号、写入数据、登记版本在同一个事务内完成，提交即原子切换；没有新行时不发布。
+    开销只与新增行数有关，不重写历史。返回 (新版本号或 None, 写入行数)。
+    """
+    own = conn is None
+    conn = connect(db_path) if own else conn
+    try:
+        conn.execute("BEGIN IMMEDIATE")  # 多个会话同时上传时串行发布
+        try:
+            last = last_date(conn)
+            if last is not None:
+                df = df.loc[pd.to_datetime(df["Calculation Date"], errors="coerce") > pd.Timestamp(last)]
+            df = df.drop_duplicates(subset=["Calculation Date"], keep="last")
+            rows = _to_rows(df)
+            if not rows:
+                conn.execute("ROLLBACK")
+                return None, 0
+            version = (latest_version(conn) or 0) + 1
+            conn.executemany("INSERT INTO rates (ordinal, sofr, sofr_date, hibor, version) VALUES (?, ?, ?, ?, ?)",
+                             [r + (version,) for r in rows])
+            conn.execute("INSERT INTO versions VALUES (?, ?, ?, ?)",
+                         (version, _now(), max(r[0] for r in rows), len(rows)))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        if own:
+            conn.close()
+    try:
+        publish_rate_file(version, db_path)
+    except OSError:
+        pass   # 二进制快照只是加速；写不了时 shared_rate_index 会从库读取
+    return version, len(rows)
+
+
+def _query(db_path: str, version: int = None):
+    # 返回 (版本号, 列名 -> 数组)；日期列保持 ordinal（浮点，NULL 为 NaN），利率列为 float
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN")  # 版本号与数据取自同一个读快照
+        if version is None:
+            version = latest_version(conn)
+        rows = conn.execute("SELECT ordinal, sofr, sofr_date, hibor FROM rates "
+                            "WHERE version <= ? ORDER BY ordinal", (version or 0,)).fetchall()
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    arr = np.array(rows, dtype=float).reshape(len(rows), 1 + len(COLUMN_MAP))
+    out = {"Calculation Date": arr[:, 0].astype(np.int64)}
+    for i, name in enumerate(COLUMN_MAP, start=1):
+        out[name] = arr[:, i]
+    return version, out
+
+
+def _to_dates(ords) -> list:
+    return [None if o != o else date.fromordinal(int(o)) for o in ords]
+
+
+def load_rates(db_path: str = DB_PATH, version: int = None) -> pd.DataFrame:
+    """
+    读出某版本（默认最新）的利率表为 sofr_df 格式（日期列为 datetime.date，利率列为 float），
+    无需解析日期字符串；版本号记在 df.attrs["rate_version"]。
+    """
+    version, data = _query(db_path, version)
+    df = pd.DataFrame(data)
+    for name in ["Calculation Date", *DATE_COLUMNS]:
+        df[name] = pd.Series(_to_dates(data[name]), dtype=object)
+    df.attrs["rate_version"] = version
+    return df
+
+
+def load_rate_index(db_path: str = DB_PATH, version: int = None, fill: str = None) -> RateIndex:
+    """直接用库内的 ordinal 数组建立某版本（默认最新）的 RateIndex（不经过日期对象）"""
+    version, data = _query(db_path, version)
+    return RateIndex.from_frame(pd.DataFrame(data), fill=fill, version=version)
+
+
+def publish_rate_file(version: int, db_path: str = DB_PATH) -> str:
+    """把某版本写成内存映射快照（原子替换），返回文件路径"""
+    return write_rate_file(load_rate_index(db_path, version), rate_file_path(db_path, version))
+
+
+@lru_cache(maxsize=8)
+def _shared_rate_index(version: int, db_path: str) -> RateIndex:
+    # 优先映射该版本的二进制快照；还没有时从库生成一次（之后其他进程直接映射）
+    path = rate_file_path(db_path, version)
+    try:
+        if not os.path.exists(path) or read_header(path)["version"] != version:
+            publish_rate_file(version, db_path)
+        return open_rate_file(path)
+    except (OSError, ValueError):
+        pass
+    # 快照截断、损坏或不是本程序写的：从库重新发布一次再映射；仍不行（如目录不可写）就直接从库载入
+    try:
+        publish_rate_file(version, db_path)
+        return open_rate_file(path)
+    except (OSError, ValueError):
+        return load_rate_index(db_path, version)
+
+
+def shared_rate_index(version: int, db_path: str = DB_PATH) -> RateIndex:
+    """
+    进程内共享的只读 RateIndex：每个版本只打开一次，所有会话拿到同一个对象（不复制）。
+    数组直接映射版本快照文件，多个 Streamlit 进程 / 批量工作进程共享同一份页缓存，
+    打开开销与利率历史长度无关。已发布版本不会再变，所以缓存无需失效；会话里只需保存版本号。
+    """
+    if version is None:
+        raise ValueError("Rate version is required; resolve the latest version first")
+    return _shared_rate_index(int(version), os.path.abspath(db_path))
+
+
+def export_csv(csv_path: str = CSV_PATH, db_path: str = DB_PATH, version: int = None) -> str:
+    """把某版本（默认最新）导出为原来的 updated_df.csv 格式；csv_path=None 时返回 CSV 文本"""
+    df = load_rates(db_path, version)
+    return df.to_csv(csv_path, index=False)
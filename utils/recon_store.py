@@ -0,0 +1,151 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from utils.rate_index import to_ordinals
+from utils.csv_validation import CSV_ONLY_STATUSES
+
+# 对账历史库：每次 CSV Validation 的转账与 DBS CSV 行都写入，用于跨日重复付款检查
+# 日期以 date.toordinal() 整数存储，金额以“分”为整数存储（比较时不受浮点误差影响）
+DB_PATH = "Tadata/recon_history.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfers (
+    run_date     INTEGER NOT NULL,
+    source       TEXT NOT NULL,       -- 当次对账的 DBS CSV 文件名
+    posting_key  TEXT,
+    posting      TEXT,
+    trade_code   TEXT,
+    currency     TEXT,
+    amount_cents INTEGER,
+    debit        TEXT,
+    credit       TEXT,
+    status       TEXT
+);
+CREATE TABLE IF NOT EXISTS csv_rows (
+    run_date     INTEGER NOT NULL,
+    source       TEXT NOT NULL,
+    row_index    INTEGER,
+    posting_key  TEXT,
+    e_full       TEXT,
+    trade_code   TEXT,
+    currency     TEXT,
+    amount_cents INTEGER,
+    debit        TEXT,
+    credit       TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_transfers_run ON transfers (run_date, source);
+CREATE INDEX IF NOT EXISTS ix_csv_run ON csv_rows (run_date, source);
+CREATE INDEX IF NOT EXISTS ix_csv_key ON csv_rows (posting_key, currency, amount_cents, run_date);
+CREATE INDEX IF NOT EXISTS ix_csv_trade ON csv_rows (trade_code, currency, amount_cents, run_date);
+"""
+
+
+def connect(db_path: str = DB_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _cents(amount: pd.Series) -> list:
+    v = pd.to_numeric(amount, errors="coerce").to_numpy(dtype=float)
+    return [None if x != x else int(round(x * 100)) for x in v]
+
+
+def _text(s: pd.Series) -> list:
+    s = s.astype("string").str.strip()
+    s = s.mask(s == "")
+    return s.astype(object).where(s.notna(), None).tolist()
+
+
+def _transfer_rows(recon_df: pd.DataFrame) -> pd.DataFrame:
+    # 转账行（CSV 侧多出的行不算）
+    return recon_df.loc[~recon_df["MatchStatus"].isin(CSV_ONLY_STATUSES)]
+
+
+def _csv_rows(recon_df: pd.DataFrame) -> pd.DataFrame:
+    # 出现过的 DBS CSV 行（匹配上的 + 多出的）
+    return recon_df.loc[recon_df["CSV_RowIndex"].notna()]
+
+
+def record_run(recon_df: pd.DataFrame, run_date, source: str, db_path: str = DB_PATH) -> int:
+    """
+    把一次对账结果写入历史库（单个事务）。同一天同一文件重复对账时整体替换，不会重复累计。
+    返回写入的行数（转账 + CSV 行）。
+    """
+    run = to_ordinals(run_date)
+    tf = _transfer_rows(recon_df)
+    cv = _csv_rows(recon_df)
+    tf_rows = list(zip(
+        [run] * len(tf), [source] * len(tf), _text(tf["PostingKey"]), _text(tf["Posting"]),
+        _text(tf["Trade Code Raw"]), _text(tf["Currency"]), _cents(tf["Amount"]),
+        _text(tf["DebitAccount"]), _text(tf["CreditAccount"]), _text(tf["MatchStatus"]),
+    ))
+    cv_rows = list(zip(
+        [run] * len(cv), [source] * len(cv), [int(i) for i in cv["CSV_RowIndex"]], _text(cv["CSV_Key_E10"]),
+        _text(cv["CSV_E_Full"]), _text(cv["CSV_TradeCodeRaw"]), _text(cv["CSV_Currency"]),
+        _cents(cv["CSV_Amount"]), _text(cv["CSV_Debit"]), _text(cv["CSV_Credit"]),
+    ))
+
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM transfers WHERE run_date = ? AND source = ?", (run, source))
+            conn.execute("DELETE FROM csv_rows WHERE run_date = ? AND source = ?", (run, source))
+            conn.executemany("INSERT INTO transfers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", tf_rows)
+            conn.executemany("INSERT INTO csv_rows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", cv_rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return len(tf_rows) + len(cv_rows)
+
+
+def prior_settlements(recon_df: pd.DataFrame, run_date, db_path: str = DB_PATH) -> pd.Series:
+    """
+    查当前转账是否已在更早日期的 DBS CSV 中出现（同 币种 + 金额，且 posting key 或 Trade Code 相同）。
+    当前转账先写入临时表，再与历史表按索引连接，不重读旧 CSV。
+    返回与 recon_df 同索引的 Series：最近一次付款日期（datetime.date），没有则为 None。
+    """
+    out = pd.Series(None, index=recon_df.index, dtype=object)
+    tf = _transfer_rows(recon_df)
+    if tf.empty:
+        return out
+
+    rows = list(zip(range(len(tf)), _text(tf["PostingKey"]), _text(tf["Trade Code Raw"]),
+                    _text(tf["Currency"]), _cents(tf["Amount"])))
+    conn = connect(db_path)
+    try:
+        conn.execute("CREATE TEMP TABLE cur (pos INTEGER, posting_key TEXT, trade_code TEXT, "
+                     "currency TEXT, amount_cents INTEGER)")
+        conn.executemany("INSERT INTO cur VALUES (?, ?, ?, ?, ?)", rows)
+        found = conn.execute("""
+            SELECT pos, MAX(run_date) FROM (
+                SELECT c.pos, h.run_date FROM cur c JOIN csv_rows h
+                  ON h.posting_key = c.posting_key AND h.currency = c.currency
+                 AND h.amount_cents = c.amount_cents AND h.run_date < :run
+                UNION ALL
+                SELECT c.pos, h.run_date FROM cur c JOIN csv_rows h
+                  ON h.trade_code = c.trade_code AND h.currency = c.currency
+                 AND h.amount_cents = c.amount_cents AND h.run_date < :run
+            ) GROUP BY pos
+        """, {"run": to_ordinals(run_date)}).fetchall()
+    finally:
+        conn.close()
+
+    if found:
+        pos, run = np.array(found, dtype=np.int64).T
+        out.loc[tf.index[pos]] = [date.fromordinal(int(o)) for o in run]
+    return out
+
+
+def flag_prior_settled(recon_df: pd.DataFrame, run_date, db_path: str = DB_PATH) -> pd.DataFrame:
+    """在对账结果上加 PaidBefore 列（更早日期已付款的转账）"""
+    recon_df = recon_df.copy()
+    recon_df["PaidBefore"] = prior_settlements(recon_df, run_date, db_path)
+    return recon_df
@@ -1,7 +1,64 @@
 
 import re
+import threading
+import hashlib
+from collections import OrderedDict
 import pandas as pd
 from datetime import date
+from utils.dic_data import defaults
+
+# ---------- 值处理函数（单笔/批量解析共用） ----------
+def _process_value(field: str, value):
+    # 空值处理
+    if pd.isna(value) or (isinstance(value, str) and value.strip() == ""):
+        return None
+
+    field_lower = str(field).lower()
+
+    # 日期字段：标量转换为 Timestamp 后取 .date()
+    if 'date' in field_lower:
+        ts = pd.to_datetime(value, dayfirst=True, errors='coerce')
+        if pd.isna(ts):
+            return None
+        return pd.Timestamp(ts).date()
+
+    # 利率字段：尽量转 float（允许 "x.xx" 或含逗号）
+    elif 'Interest (I + OI)' in field:
+        try:
+            return float(str(value).replace(',', ''))
+        except Exception:
+            return None
+
+    # 天数字段：转 int
+    elif 'days' in field_lower:
+        try:
+            return int(str(value).replace(',', ''))
+        except Exception:
+            return None
+
+    # 其他数值类：尝试转 float（去掉逗号、括号）
+    else:
+        sv = str(value).strip()
+        # 处理会计负数样式 "(123.45)" → -123.45
+        is_paren_negative = sv.startswith('(') and sv.endswith(')')
+        sv_clean = sv.replace(',', '').strip('()')
+        try:
+            num = float(sv_clean)
+            return -num if is_paren_negative else num
+        except Exception:
+            # 非数值，原样返回
+            return value
+
+
+# ---------- Waive Items 转负（若存在则 -abs(...)，否则为 0.0/None） ----------
+def _negate_abs(val):
+    if val is None or pd.isna(val):
+        return 0.0
+    try:
+        return -abs(float(val))
+    except Exception:
+        return 0.0
+
 
 def parse_lms_to_dic(raw_input: str) -> dict:
     """
@@ -34,53 +91,11 @@ def parse_lms_to_dic(raw_input: str) -> dict:
 
     df = pd.DataFrame(rows, columns=["field", "value", "section"])
 
-    # ---------- 3) 值处理函数 ----------
-    def process_value(field: str, value):
-        # 空值处理
-        if pd.isna(value) or (isinstance(value, str) and value.strip() == ""):
-            return None
-
-        field_lower = str(field).lower()
-
-        # 日期字段：标量转换为 Timestamp 后取 .date()
-        if 'date' in field_lower:
-            ts = pd.to_datetime(value, dayfirst=True, errors='coerce')
-            if pd.isna(ts):
-                return None
-            return pd.Timestamp(ts).date()
-
-        # 利率字段：尽量转 float（允许 "x.xx" 或含逗号）
-        elif 'Interest (I + OI)' in field:
-            try:
-                return float(str(value).replace(',', ''))
-            except Exception:
-                return None
-
-        # 天数字段：转 int
-        elif 'days' in field_lower:
-            try:
-                return int(str(value).replace(',', ''))
-            except Exception:
-                return None
-
-        # 其他数值类：尝试转 float（去掉逗号、括号）
-        else:
-            sv = str(value).strip()
-            # 处理会计负数样式 "(123.45)" → -123.45
-            is_paren_negative = sv.startswith('(') and sv.endswith(')')
-            sv_clean = sv.replace(',', '').strip('()')
-            try:
-                num = float(sv_clean)
-                return -num if is_paren_negative else num
-            except Exception:
-                # 非数值，原样返回
-                return value
-
     # 应用逐行转换
     if not df.empty:
-        df['value'] = df.apply(lambda row: process_value(row['field'], row['value']), axis=1)
+        df['value'] = df.apply(lambda row: _process_value(row['field'], row['value']), axis=1)
 
-    # ---------- 4) 安全取值工具，避免 iloc[0] 越界 ----------
+    # ---------- 3) 安全取值工具，避免 iloc[0] 越界 ----------
     def safe_pick(field_name: str, section_name: str, default=None):
         ser = df.loc[
             (df["field"] == field_name) & (df["section"] == section_name),
@@ -97,22 +112,13 @@ def parse_lms_to_dic(raw_input: str) -> dict:
         return value
 
 
-    # ---------- 5) Waive Items 转负（若存在则 -abs(...)，否则为 0.0/None） ----------
-    def negate_abs(val):
-        if val is None or pd.isna(val):
-            return 0.0
-        try:
-            return -abs(float(val))
-        except Exception:
-            return 0.0
-
-    # ---------- 6) Surcharge Items 汇总 ----------
+    # ---------- 4) Surcharge Items 汇总 ----------
     surcharge_series = df.loc[df["section"] == "Surcharge Items", "value"]
     # 将可解析项转 float，失败的变为 NaN，然后 sum() 跳过 NaN
     surcharge_sum = pd.to_numeric(surcharge_series, errors='coerce').sum() if not surcharge_series.empty else 0.0
     
 
-    # ---------- 7) 组装结果字典 ----------
+    # ---------- 5) 组装结果字典 ----------
     lms_data = {
         # 基本信息
         "drawdown_id": str(safe_pick("Drawdown ID", "Payment Details", default=None)),
@@ -141,9 +147,9 @@ def parse_lms_to_dic(raw_input: str) -> dict:
         "sme_sysodint": safe_pick("Overdue Interest", "SME Transaction", default=0.0),
 
         # Waive Items：负号处理
-        "waived_bankcharge": negate_abs(safe_pick("Bank Charge", "Waive Items", default=None)),
-        "waived_smeint": negate_abs(safe_pick("Interest", "Waive Items", default=None)),
-        "waived_smeodint": negate_abs(safe_pick("Overdue Interest", "Waive Items", default=None)),
+        "waived_bankcharge": _negate_abs(safe_pick("Bank Charge", "Waive Items", default=None)),
+        "waived_smeint": _negate_abs(safe_pick("Interest", "Waive Items", default=None)),
+        "waived_smeodint": _negate_abs(safe_pick("Overdue Interest", "Waive Items", default=None)),
 
         # Return to borrower
         "rtb_sys": safe_pick("Return To Borrower", "SME Transaction", default=0.0),
@@ -152,7 +158,7 @@ def parse_lms_to_dic(raw_input: str) -> dict:
         "funder_id": str(safe_pick("Funder ID", "Funder Information", default=None)),
         "funder_sysint": safe_pick("Interest (I + OI)", "Funder Transaction", default=0.0),
         "funder_intrate": safe_pick("Interest Rate (% p.a.)", "Funder Transaction", default=0.0),
-        "platform_fee": negate_abs(safe_pick("Platform Fee", "Funder Transaction", default=None)),
+        "platform_fee": _negate_abs(safe_pick("Platform Fee", "Funder Transaction", default=None)),
         "funder_sysallocation": float(safe_pick("Total Allocation", "Funder Transaction", default=0.0)),
 
         # FundPark
@@ -166,6 +172,171 @@ def parse_lms_to_dic(raw_input: str) -> dict:
 
 
 
+# ---------- 批量解析：一次粘贴/一个文件内的多笔 LMS 交易 ----------
+# 输出键 -> (LMS 字段, Section, 缺省值)；与 parse_lms_to_dic 的取值规则一致
+LMS_FIELD_MAP = {
+    "drawdown_id": ("Drawdown ID", "Payment Details", None),
+    "repayment_id": ("Repayment ID", "Payment Details", None),
+    "currency": ("Repayment Currency", "Payment Details", None),
+    "sme_drawdown": ("SME Disbursement Date", "Payment Details", None),
+    "funder_drawdown": ("Funder Disbursement Date", "Funder Information", None),
+    "last_funder_submission": ("Last Funder Submission Date", "Funder Information", None),
+    "repayment_date": ("Repayment Date", "Payment Details", None),
+    "sme_tenor": ("Tenor", "SME Information", None),
+    "sme_mit": ("MIT (Days)", "SME Information", None),
+    "repayment_amount": ("Repayment Amount", "Payment Details", 0.0),
+    "outstanding_principal": ("Outstanding Principal", "SME Transaction", 0.0),
+    "principal": ("Principal", "Funder Transaction", 0.0),
+    "bank_charge": ("Bank Charge", "Payment Details", 0.0),
+    "sme_intrate": ("Interest Rate (% p.a.)", "SME Information", None),
+    "sme_sysint": ("Interest", "SME Transaction", 0.0),
+    "sme_sysodint": ("Overdue Interest", "SME Transaction", 0.0),
+    "waived_bankcharge": ("Bank Charge", "Waive Items", None),
+    "waived_smeint": ("Interest", "Waive Items", None),
+    "waived_smeodint": ("Overdue Interest", "Waive Items", None),
+    "rtb_sys": ("Return To Borrower", "SME Transaction", 0.0),
+    "funder_id": ("Funder ID", "Funder Information", None),
+    "funder_sysint": ("Interest (I + OI)", "Funder Transaction", 0.0),
+    "funder_intrate": ("Interest Rate (% p.a.)", "Funder Transaction", 0.0),
+    "platform_fee": ("Platform Fee", "Funder Transaction", None),
+    "funder_sysallocation": ("Total Allocation", "Funder Transaction", 0.0),
+    "spreading_sysint": ("FundPark Spreading", "FundPark Transaction", 0.0),
+}
+LMS_STR_KEYS = {"drawdown_id", "repayment_id", "currency", "funder_id"}
+LMS_NEGATE_KEYS = {"waived_bankcharge", "waived_smeint", "waived_smeodint", "platform_fee"}
+SURCHARGE_SECTION = "Surcharge Items"
+
+_SECTION_TITLE = re.compile(r"[A-Z][A-Za-z ]+")
+
+
+def _to_float(val):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def iter_lms_records(lines):
+    """
+    逐行扫描 LMS 文本，按交易切分，逐笔产出 (fields, surcharges)：
+    - fields：{(section, field): 原始 value}，同一 section/field 只保留第一次出现
+    - surcharges：Surcharge Items 下所有原始 (field, value)
+    - 标题行规则同 parse_lms_to_dic；整段文本的第一个标题（如 Payment Details）再次出现即视为下一笔开始
+    lines 可以是整段字符串，也可以是逐行迭代的文件对象。
+    """
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+
+    fields, surcharges = {}, []
+    title = first_title = None
+    for line in lines:
+        line = line.rstrip("\n")
+        if first_title is None:
+            if not line.strip():
+                continue
+            title = first_title = line.strip()
+            continue
+        # 标题行尾的空格（粘贴时常带出）不算标题的一部分：与 parse_lms_to_dic 一样按去空白后的值匹配和记录；
+        # 数据行保持原样（"Overdue Interest\t" 这种空值行要保留 tab）
+        head = line.rstrip(" \r")
+        if _SECTION_TITLE.fullmatch(head):
+            if head == first_title:
+                yield fields, surcharges
+                fields, surcharges = {}, []
+            title = head
+            continue
+        parts = line.split("\t")
+        if len(parts) >= 2:
+            field, value = parts[0].strip(), parts[1].strip()
+            fields.setdefault((title, field), value)
+            if title == SURCHARGE_SECTION:
+                surcharges.append((field, value))
+    if first_title is not None:
+        yield fields, surcharges
+
+
+def lms_record_to_dic(fields: dict, surcharges: list) -> dict:
+    """把 iter_lms_records 的一笔原始字段转成与 parse_lms_to_dic 相同的字典，只转换用到的字段"""
+    out = {}
+    for key, (field, section, default) in LMS_FIELD_MAP.items():
+        raw = fields.get((section, field))
+        if raw is None:
+            val = default
+        else:
+            val = _process_value(field, raw)
+            if isinstance(val, str) and "day" in val.lower():
+                val = val.replace("Day", "").replace("day", "").strip()
+        if key in LMS_STR_KEYS:
+            val = str(val)
+        elif key in LMS_NEGATE_KEYS:
+            val = _negate_abs(val)
+        elif key == "funder_sysallocation":
+            val = _to_float(val)
+        out[key] = val
+
+    total = 0.0
+    for field, raw in surcharges:
+        val = _process_value(field, raw)
+        if isinstance(val, (int, float)) and not isinstance(val, bool) and not pd.isna(val):
+            total += val
+    out["surcharge_item"] = float(total)
+    return out
+
+
+def parse_lms_batch(source) -> pd.DataFrame:
+    """
+    批量解析：一段粘贴文本或一个文本文件里的多笔 LMS 交易 → 每笔一行的 DataFrame。
+    - 列名与 utils.dic_data.defaults 一致（intmethod 无对应 LMS 字段，保持缺省值）
+    - 日期列为 datetime64，天数列为 Int64，金额列为 float，其余为 string
+    - 逐行流式处理，不为每笔交易构建中间 DataFrame
+    """
+    rows = [lms_record_to_dic(f, s) for f, s in iter_lms_records(source)]
+    df = pd.DataFrame(rows, columns=list(defaults))
+    for k, v in defaults.items():
+        if isinstance(v, date):
+            df[k] = pd.to_datetime(df[k], errors="coerce")
+        elif isinstance(v, int):
+            df[k] = pd.to_numeric(df[k], errors="coerce").astype("Int64")
+        elif isinstance(v, float):
+            df[k] = pd.to_numeric(df[k], errors="coerce").astype(float)
+        else:
+            df[k] = df[k].fillna(v).astype("string")
+    return df
+
+
+# ---------- 单笔快速解析：逐行一次扫描 + 按内容哈希缓存（供页面每次输入时调用） ----------
+_LMS_CACHE_SIZE = 256
+_lms_cache = OrderedDict()
+_lms_lock = threading.Lock()   # Streamlit 每个会话一个线程，缓存的读写都要在锁内
+
+
+def parse_lms_fast(raw_input: str) -> dict:
+    """
+    与 parse_lms_to_dic 返回相同的字典，但不构建 DataFrame：
+    - 一次扫描得到 {(section, field): value}，每个输出字段一次字典查找
+    - 只转换输出用到的字段
+    - 结果按文本的 sha1 缓存（LRU），同一段粘贴重复触发时直接返回
+    粘贴多笔时只取第一笔。
+    """
+    key = hashlib.sha1(raw_input.encode("utf-8")).hexdigest()
+    with _lms_lock:
+        hit = _lms_cache.get(key)
+        if hit is not None:
+            _lms_cache.move_to_end(key)
+            return dict(hit)
+
+    # 解析在锁外进行，不阻塞其他会话；两个会话同时解析同一段文本时结果相同，后写入的覆盖即可
+    record = next(iter_lms_records(raw_input), ({}, []))
+    lms_data = lms_record_to_dic(*record)
+
+    with _lms_lock:
+        _lms_cache[key] = lms_data
+        _lms_cache.move_to_end(key)
+        while len(_lms_cache) > _LMS_CACHE_SIZE:
+            _lms_cache.popitem(last=False)
+    return dict(lms_data)
+
+
 def process_email_data(text,today,maker_name):
 
     lines = [l.strip() for l in text.splitlines()]